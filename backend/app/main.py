@@ -8,15 +8,19 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import os
 from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import orjson
+from fastapi import FastAPI, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from .models.database import async_session, init_db
 from .routers import checkpoints, generation, gpus, iteration, loras, models, preferences, sessions
 from .services.comfyui_client import ComfyUIClientPool
+from .services.generation_dispatcher import GenerationDispatcher
 from .services.gpu_registry import GPURegistry
 from .services.image_store import ImageStore
 from .services.task_router import TaskRouter
@@ -34,22 +38,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Resolve paths relative to the backend directory
-BACKEND_DIR = Path(__file__).resolve().parent.parent
+# Resolve paths relative to the backend directory (computed once at import,
+# without Path.resolve()'s per-component realpath lookups)
+_HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = Path(os.path.dirname(_HERE))
 PROJECT_DIR = BACKEND_DIR.parent
 
 # When running in Docker, use absolute paths for mounted volumes
 # When running locally, use relative paths
-if Path("/app/config/gpus.yaml").exists():
+_DOCKER_CONFIG_PATH = "/app/config/gpus.yaml"
+if os.path.exists(_DOCKER_CONFIG_PATH):
     # Running in Docker
-    CONFIG_PATH = Path("/app/config/gpus.yaml")
+    CONFIG_PATH = Path(_DOCKER_CONFIG_PATH)
     DATA_DIR = Path("/app/data")
 else:
     # Running locally
     CONFIG_PATH = PROJECT_DIR / "config" / "gpus.yaml"
     DATA_DIR = PROJECT_DIR / "data"
 
-TEMPLATES_DIR = Path(__file__).resolve().parent / "templates" / "workflows"
+TEMPLATES_DIR = Path(_HERE, "templates", "workflows")
 
 
 @asynccontextmanager
@@ -105,6 +112,11 @@ async def lifespan(app: FastAPI):
     logger.info("Discovered %d checkpoints and %d LoRAs from NAS",
                nas_models.get("checkpoints", 0), nas_models.get("loras", 0))
 
+    # 7b. Start the preference writer and per-GPU generation workers
+    preference_learning.start_writer(async_session)
+    generation_dispatcher = GenerationDispatcher()
+    generation_dispatcher.start(gpu_registry)
+
     # 8. Start GPU health checks
     health_task = gpu_registry.start_background_health_checks(interval=10.0)
 
@@ -120,6 +132,8 @@ async def lifespan(app: FastAPI):
     app.state.preference_learning = preference_learning
     app.state.model_sync = model_sync
     app.state.vision_analysis = vision_analysis
+    app.state.generation_dispatcher = generation_dispatcher
+    app.state.batch_counters = {}  # batch_id -> completed/failed/total counts
     app.state.db_session = async_session  # session factory for background tasks
 
     # Run initial health check
@@ -134,12 +148,21 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down...")
     gpu_registry.stop_health_checks()
+    await generation_dispatcher.stop()
     await lora_discovery.stop_polling()
     await progress_aggregator.stop_listeners()
+    await vision_analysis.cancel_background()
+    await preference_learning.stop_writer()
     await client_pool.close_all()
+    await gpu_registry.close()
 
 
-app = FastAPI(title="Vibes ImGen", version="0.1.0", lifespan=lifespan)
+app = FastAPI(
+    title="Vibes ImGen",
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -160,28 +183,81 @@ app.include_router(preferences.router)
 app.include_router(gpus.router)
 
 
+# Interval between server-initiated pings on frontend WebSockets
+WS_PING_INTERVAL = 20.0
+
+
+async def _drain_frontend(websocket: WebSocket) -> None:
+    """Consume (and ignore) frontend heartbeats until the socket closes."""
+    while True:
+        await websocket.receive_text()
+
+
+async def _ping_frontend(websocket: WebSocket, interval: float) -> None:
+    """Ping the frontend periodically; raises once the peer is gone."""
+    while True:
+        await asyncio.sleep(interval)
+        await websocket.send_json({"type": "ping"})
+
+
 # WebSocket endpoint for frontend session connections
 @app.websocket("/ws/session/{session_id}")
 async def session_websocket(websocket: WebSocket, session_id: str):
     await websocket.accept()
     aggregator: ProgressAggregator = app.state.progress_aggregator
     await aggregator.connect_frontend(session_id, websocket)
+
+    # Whichever finishes first (client disconnect or failed ping) ends the session,
+    # so dead peers are dropped within one ping interval.
+    recv_task = asyncio.create_task(_drain_frontend(websocket))
+    ping_task = asyncio.create_task(_ping_frontend(websocket, WS_PING_INTERVAL))
     try:
-        while True:
-            # Keep alive - frontend may send ping/heartbeat
-            await websocket.receive_text()
-    except WebSocketDisconnect:
+        done, pending = await asyncio.wait(
+            {recv_task, ping_task}, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in pending:
+            task.cancel()
+        for task in done:
+            exc = task.exception()
+            if exc and not isinstance(exc, WebSocketDisconnect):
+                logger.debug("Frontend WS for session %s closed: %s", session_id, exc)
+    finally:
+        recv_task.cancel()
+        ping_task.cancel()
         await aggregator.disconnect_frontend(session_id, websocket)
 
 
+# Encoded /health bodies keyed by (healthy, total); only a handful ever exist
+_health_bodies: dict[tuple[int, int], bytes] = {}
+
+
 @app.get("/health")
 async def health():
     """Simple health check endpoint."""
     registry: GPURegistry = app.state.gpu_registry
-    healthy = len(registry.get_healthy_nodes())
-    total = len(registry.nodes)
-    return {
-        "status": "ok",
-        "gpus_healthy": healthy,
-        "gpus_total": total,
-    }
+    counts = (registry.healthy_count, len(registry.nodes))
+    body = _health_bodies.get(counts)
+    if body is None:
+        body = orjson.dumps({
+            "status": "ok",
+            "gpus_healthy": counts[0],
+            "gpus_total": counts[1],
+        })
+        _health_bodies[counts] = body
+    return Response(content=body, media_type="application/json")
+
+
+if __name__ == "__main__":
+    # `python -m app.main`: prefer uvloop/httptools where available
+    # (both come with uvicorn[standard]; uvloop is not available on Windows)
+    import importlib.util
+
+    import uvicorn
+
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8001,
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        http="httptools" if importlib.util.find_spec("httptools") else "h11",
+    )
@@ -1,22 +1,181 @@
 """Database setup and session management."""
 
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, fall back to unguarded init
+    fcntl = None
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
-DATABASE_URL = "sqlite+aiosqlite:///./data/imgen.db"
+logger = logging.getLogger(__name__)
+
+DATABASE_PATH = "./data/imgen.db"
+DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+
+# Bump whenever tables or indexes are added or removed so init_db() runs the
+# upgrade again. The upgrade creates missing tables, creates any missing index
+# on existing tables (create_all alone skips those), then drops
+# OBSOLETE_INDEXES. Column changes such as new foreign keys are NOT applied
+# to existing tables; they only take effect on newly created databases.
+# Version 5 re-runs the upgrade for databases stamped 4 before missing
+# indexes were created on existing tables. Version 6 converts text UUIDs in
+# the preference tables to the 16-byte form UUIDBinary binds.
+SCHEMA_VERSION = 6
+
+# Indexes replaced by later schema versions; dropped when upgrading.
+OBSOLETE_INDEXES = (
+    "idx_checkpoint",
+    "idx_keywords",
+    "idx_action",
+    "ix_generations_batch_id",
+    "ix_generations_session_id",
+)
+
+# UUIDBinary columns whose rows may predate it and still hold 36-char text.
+# Text never equals the 16-byte value UUIDBinary binds, so ORM UPDATE/DELETE
+# by id would match nothing; the upgrade converts them.
+UUID_BLOB_COLUMNS = (
+    ("user_preferences", ("id", "session_id", "generation_id")),
+    ("preference_stats", ("id",)),
+    ("image_cleanup", ("id", "generation_id")),
+)
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+# Applied to every new SQLite connection. WAL + synchronous=NORMAL avoids the
+# double fsync per commit of the default rollback journal, which matters because
+# every generation/preference write is its own small transaction.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",  # 256MB
+    "PRAGMA cache_size=-65536",  # 64MB
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA journal_size_limit=6144000",
+    "PRAGMA foreign_keys=ON",  # enforce ON DELETE CASCADE
+)
+
+# Connections are pooled and reused across requests so the PRAGMAs above are
+# issued once per connection, not once per Depends(get_session). Besides HTTP
+# requests, every generation worker and background vision analysis checks out
+# a connection, so the pool is sized for that concurrency. WAL lets readers
+# proceed in parallel; writers still serialize, and each connection carries
+# its own page cache, so the pool stays well short of "one per request".
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=False,
+    connect_args={"check_same_thread": False},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=10,
+    max_overflow=10,
+    pool_timeout=30,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Tune each new SQLite connection for a write-heavy workload."""
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
 class Base(DeclarativeBase):
     pass
 
 
+def utcnow() -> datetime:
+    """Timezone-aware current UTC time, used as the default for timestamp columns."""
+    return datetime.now(timezone.utc)
+
+
+def _acquire_init_lock() -> int | None:
+    """Block until this process holds the schema-init file lock."""
+    if fcntl is None:
+        return None
+    os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
+    fd = os.open(f"{DATABASE_PATH}.init.lock", os.O_CREAT | os.O_RDWR, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    return fd
+
+
+def _release_init_lock(fd: int | None) -> None:
+    if fd is None:
+        return
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+def _create_missing_indexes(sync_conn) -> None:
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
+def _convert_text_uuids(sync_conn) -> None:
+    for table, columns in UUID_BLOB_COLUMNS:
+        for column in columns:
+            rows = sync_conn.exec_driver_sql(
+                f"SELECT rowid, {column} FROM {table} WHERE typeof({column}) = 'text'"
+            ).all()
+            params = []
+            for rowid, value in rows:
+                try:
+                    params.append((uuid.UUID(value).bytes, rowid))
+                except ValueError:
+                    logger.warning("Leaving non-UUID %s.%s value %r as text", table, column, value)
+            if params:
+                sync_conn.exec_driver_sql(f"UPDATE {table} SET {column} = ? WHERE rowid = ?", params)
+                logger.info("Converted %d text UUID(s) in %s.%s", len(params), table, column)
+
+
+async def upgrade_schema(conn) -> None:
+    """
+    Bring an existing (or empty) database up to SCHEMA_VERSION.
+
+    Replacement indexes are created before the obsolete ones are dropped,
+    so queries are never left without an index.
+    """
+    await conn.run_sync(Base.metadata.create_all)
+    await conn.run_sync(_create_missing_indexes)
+    await conn.run_sync(_convert_text_uuids)
+    for index_name in OBSOLETE_INDEXES:
+        await conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index_name}")
+    await conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
 async def init_db() -> None:
-    """Create all tables if they don't exist."""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """
+    Create all tables if they don't exist.
+
+    With several uvicorn workers only the first one to take the file lock
+    runs the DDL; it then records SCHEMA_VERSION in PRAGMA user_version and
+    the others see it and skip create_all.
+    """
+    lock_fd = await asyncio.to_thread(_acquire_init_lock)
+    try:
+        async with engine.begin() as conn:
+            result = await conn.exec_driver_sql("PRAGMA user_version")
+            version = result.scalar() or 0
+            if version >= SCHEMA_VERSION:
+                logger.info("Database schema at version %d, skipping create_all", version)
+                return
+            await upgrade_schema(conn)
+            logger.info("Database schema created/upgraded to version %d", SCHEMA_VERSION)
+    finally:
+        _release_init_lock(lock_fd)
 
 
 async def get_session() -> AsyncSession:
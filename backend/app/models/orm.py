@@ -1,10 +1,14 @@
 """SQLAlchemy ORM models for sessions, generations, and feedback."""
 
-from datetime import datetime, timezone
+from sqlalchemy import (
+    Column, DateTime, Float, ForeignKey, Index, Integer, JSON, String, Text, bindparam, lambda_stmt,
+    select,
+)
 
-from sqlalchemy import Column, DateTime, Float, Integer, JSON, String, Text
+from sqlalchemy.orm import relationship
 
-from .database import Base
+from .database import Base, utcnow
+from .types import MsgPackType
 
 
 class SessionORM(Base):
@@ -12,27 +16,39 @@ class SessionORM(Base):
 
     id = Column(String, primary_key=True)
     flow_type = Column(String, nullable=False)  # concept_builder | draft_grid | explorer
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow)
     current_stage = Column(Integer, default=0)
     config = Column(JSON, nullable=True)
     intent_document = Column(JSON, nullable=True)  # accumulated user intent
 
+    # Read-only and never lazy-loaded; use selectinload() where it's needed.
+    # On databases created with the foreign key, deleting a session removes
+    # its generations via ON DELETE CASCADE; older tables lack it, so
+    # delete_session also deletes them explicitly.
+    generations = relationship(
+        "GenerationORM",
+        viewonly=True,
+        lazy="raise",
+    )
+
 
 class GenerationORM(Base):
     __tablename__ = "generations"
 
     id = Column(String, primary_key=True)
-    session_id = Column(String, nullable=False, index=True)
+    session_id = Column(
+        String, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False
+    )
     stage = Column(Integer, nullable=False)
-    batch_id = Column(String, nullable=True, index=True)
+    batch_id = Column(String, nullable=True)
     batch_index = Column(Integer, nullable=True)
     prompt = Column(Text)
     negative_prompt = Column(Text)
     model_family = Column(String)
     checkpoint = Column(String)
     task_type = Column(String)
-    parameters = Column(JSON)  # full snapshot of all params
-    loras = Column(JSON)
+    parameters = Column(MsgPackType)  # full snapshot of all params
+    loras = Column(MsgPackType)
     gpu_id = Column(String)
     prompt_comfy_id = Column(String)  # ComfyUI's prompt_id
     image_path = Column(String)
@@ -46,7 +62,17 @@ class GenerationORM(Base):
     generation_time_ms = Column(Integer)
     status = Column(String, default="queued")  # queued | generating | complete | error
     error_message = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow)
+
+    # (batch_id, status) serves per-batch lookups as well as index-only
+    # "how many of this batch are complete" counts. (session_id, stage,
+    # created_at DESC) serves "latest generation of this stage" without a
+    # sort, and its session_id prefix covers per-session listings and the
+    # cascade delete.
+    __table_args__ = (
+        Index("ix_gen_batch_status", "batch_id", "status"),
+        Index("ix_gen_session_stage_created", "session_id", "stage", created_at.desc()),
+    )
 
 
 class FeedbackORM(Base):
@@ -61,4 +87,10 @@ class FeedbackORM(Base):
     feedback_text = Column(Text, nullable=True)
     parameter_adjustments = Column(JSON, nullable=True)
     resulting_prompt = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow)
+
+
+# Primary-key lookup used on every image request, built once as a lambda
+# statement so SQLAlchemy's compiled cache is hit without reconstructing the
+# expression. Execute with {"gid": ...}. (Sessions go through db.get().)
+GENERATION_BY_ID = lambda_stmt(lambda: select(GenerationORM).where(GenerationORM.id == bindparam("gid")))
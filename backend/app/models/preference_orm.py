@@ -7,13 +7,14 @@ Tracks user selections/rejections with full context for learning.
 from __future__ import annotations
 
 import uuid
-from datetime import datetime, timezone
-from typing import Optional
+from datetime import datetime
+from typing import Any, Optional
 
-from sqlalchemy import String, Text, Integer, Float, Boolean, DateTime, Index
+from sqlalchemy import JSON, String, Text, Integer, Float, Boolean, DateTime, Index
 from sqlalchemy.orm import Mapped, mapped_column
 
-from .database import Base
+from .database import Base, utcnow
+from .types import UUIDBinary
 
 
 class UserPreferenceORM(Base):
@@ -27,12 +28,12 @@ class UserPreferenceORM(Base):
 
     # Primary key
     id: Mapped[str] = mapped_column(
-        String(36), primary_key=True, default=lambda: str(uuid.uuid4())
+        UUIDBinary, primary_key=True, default=lambda: str(uuid.uuid4())
     )
 
     # Timestamp
     timestamp: Mapped[datetime] = mapped_column(
-        DateTime, default=lambda: datetime.now(timezone.utc), nullable=False
+        DateTime, default=utcnow, nullable=False
     )
 
     # User context (for multi-user future)
@@ -40,12 +41,12 @@ class UserPreferenceORM(Base):
 
     # Input context
     prompt: Mapped[str] = mapped_column(Text, nullable=False)
-    keywords: Mapped[str] = mapped_column(Text, nullable=False)  # JSON array
+    keywords: Mapped[list[str]] = mapped_column(JSON, nullable=False)
     negative_prompt: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
 
     # Generation settings
     checkpoint: Mapped[str] = mapped_column(String(255), nullable=False)
-    loras: Mapped[str] = mapped_column(Text, nullable=False)  # JSON array of {name, strength}
+    loras: Mapped[list[dict[str, Any]]] = mapped_column(JSON, nullable=False)  # [{name, strength}]
     model_family: Mapped[str] = mapped_column(String(50), nullable=False)  # "sd15" or "sdxl"
     task_type: Mapped[str] = mapped_column(String(50), nullable=False)  # "draft", "standard", "quality"
 
@@ -55,19 +56,20 @@ class UserPreferenceORM(Base):
     stage: Mapped[int] = mapped_column(Integer, nullable=False)
 
     # Metadata
-    session_id: Mapped[str] = mapped_column(String(36), nullable=False)
-    generation_id: Mapped[str] = mapped_column(String(36), nullable=False)
+    session_id: Mapped[str] = mapped_column(UUIDBinary, nullable=False)
+    generation_id: Mapped[str] = mapped_column(UUIDBinary, nullable=False)
 
     # Optional: Vision analysis (if enabled)
     vision_description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
-    vision_themes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # JSON array
+    vision_themes: Mapped[Optional[list[str]]] = mapped_column(JSON, nullable=True)
 
-    # Indexes for fast queries
+    # Indexes for fast queries. Compound indexes match the aggregation
+    # filters (user + checkpoint/action) so they're served index-only.
+    # PostgreSQL would additionally want a GIN index on keywords (JSONB).
     __table_args__ = (
         Index("idx_user_timestamp", "user_id", "timestamp"),
-        Index("idx_checkpoint", "checkpoint"),
-        Index("idx_keywords", "keywords"),  # PostgreSQL would want GIN index for JSONB
-        Index("idx_action", "action"),
+        Index("idx_user_checkpoint_action", "user_id", "checkpoint", "action"),
+        Index("idx_user_action_ts", "user_id", "action", "timestamp"),
         Index("idx_session", "session_id"),
     )
 
@@ -85,7 +87,7 @@ class PreferenceStatsORM(Base):
 
     # Composite key
     id: Mapped[str] = mapped_column(
-        String(36), primary_key=True, default=lambda: str(uuid.uuid4())
+        UUIDBinary, primary_key=True, default=lambda: str(uuid.uuid4())
     )
 
     # User context
@@ -103,7 +105,7 @@ class PreferenceStatsORM(Base):
 
     # Metadata
     last_updated: Mapped[datetime] = mapped_column(
-        DateTime, default=lambda: datetime.now(timezone.utc), nullable=False
+        DateTime, default=utcnow, nullable=False
     )
 
     # Indexes
@@ -120,10 +122,10 @@ class ImageCleanupORM(Base):
     __tablename__ = "image_cleanup"
 
     id: Mapped[str] = mapped_column(
-        String(36), primary_key=True, default=lambda: str(uuid.uuid4())
+        UUIDBinary, primary_key=True, default=lambda: str(uuid.uuid4())
     )
 
-    generation_id: Mapped[str] = mapped_column(String(36), nullable=False)
+    generation_id: Mapped[str] = mapped_column(UUIDBinary, nullable=False)
     image_path: Mapped[str] = mapped_column(String(512), nullable=False)
 
     # Status
@@ -5,7 +5,7 @@ from __future__ import annotations
 from datetime import datetime
 from enum import Enum
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 # --- Enums ---
@@ -109,22 +109,6 @@ class BatchGenerationRequest(BaseModel):
     auto_lora: bool = False  # Automatically discover and apply relevant LoRAs
 
 
-class FeedbackRequest(BaseModel):
-    session_id: str
-    selected_image_ids: list[str] = Field(default_factory=list)
-    rejected_image_ids: list[str] = Field(default_factory=list)
-    action: FeedbackAction
-    feedback_text: str | None = None
-    parameter_adjustments: dict | None = None
-
-
-class PromptRefineRequest(BaseModel):
-    session_id: str
-    current_prompt: str
-    feedback_text: str
-    reference_image_ids: list[str] = Field(default_factory=list)
-
-
 class ConceptBuilderRequest(BaseModel):
     session_id: str
     concepts: ConceptFields
@@ -135,7 +119,18 @@ class ConceptBuilderRequest(BaseModel):
 
 # --- Response Models ---
 
-class SessionResponse(BaseModel):
+class ResponseModel(BaseModel):
+    """
+    Base for response models.
+
+    Responses are built from our own DB rows / registry state, so routes
+    may use model_construct() to skip validation. Schemas are built eagerly
+    at import and instances are immutable once returned.
+    """
+    model_config = ConfigDict(frozen=True, defer_build=False, validate_assignment=False)
+
+
+class SessionResponse(ResponseModel):
     id: str
     flow_type: FlowType
     created_at: datetime
@@ -143,7 +138,7 @@ class SessionResponse(BaseModel):
     config: dict | None = None
 
 
-class GenerationResponse(BaseModel):
+class GenerationResponse(ResponseModel):
     id: str
     session_id: str
     status: str
@@ -151,14 +146,14 @@ class GenerationResponse(BaseModel):
     prompt_id: str | None = None
 
 
-class BatchGenerationResponse(BaseModel):
+class BatchGenerationResponse(ResponseModel):
     batch_id: str
     session_id: str
     total_count: int
     gpu_assignments: dict[str, int]  # gpu_id -> count
 
 
-class GenerationResultResponse(BaseModel):
+class GenerationResultResponse(ResponseModel):
     id: str
     session_id: str
     stage: int
@@ -173,20 +168,7 @@ class GenerationResultResponse(BaseModel):
     created_at: datetime
 
 
-class IterationPlanResponse(BaseModel):
-    suggested_prompt: str
-    suggested_negative: str
-    suggested_parameters: dict
-    task_type: TaskType
-    model_family: ModelFamily
-    use_img2img: bool
-    source_image_id: str | None = None
-    denoise_strength: float
-    count: int = 4
-    rationale: str
-
-
-class GPUStatusResponse(BaseModel):
+class GPUStatusResponse(ResponseModel):
     id: str
     name: str
     tier: str
@@ -6,13 +6,14 @@ import logging
 from typing import Dict, Any
 
 from fastapi import APIRouter, Request
+from fastapi.responses import ORJSONResponse
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/checkpoints", tags=["checkpoints"])
 
 
-@router.get("/stats", response_model=Dict[str, Dict[str, Any]])
+@router.get("/stats", response_class=ORJSONResponse)
 async def get_checkpoint_stats(request: Request):
     """
     Get checkpoint performance statistics.
@@ -20,7 +21,8 @@ async def get_checkpoint_stats(request: Request):
     Returns: {checkpoint_name: {selected: int, total: int, selection_rate: float}}
     """
     checkpoint_learning = request.app.state.checkpoint_learning
-    return checkpoint_learning.get_stats_summary()
+    # Plain dict of built-in types: encode directly, no response_model pass
+    return ORJSONResponse(checkpoint_learning.get_stats_summary())
 
 
 @router.get("/pools", response_model=Dict[str, Any])
@@ -31,4 +33,8 @@ async def get_checkpoint_pools(request: Request):
     Returns: {pool_name: [checkpoint_names...]}
     """
     checkpoint_learning = request.app.state.checkpoint_learning
-    return checkpoint_learning.checkpoint_pools
+    # Pools are static config; let the browser reuse the response for a minute
+    return ORJSONResponse(
+        checkpoint_learning.checkpoint_pools,
+        headers={"Cache-Control": "max-age=60"},
+    )
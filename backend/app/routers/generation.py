@@ -4,18 +4,21 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import os
 import random
 import time
 import uuid
 from datetime import datetime, timezone
+from functools import partial
+from itertools import chain, repeat
 
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import Response
-from sqlalchemy import select
+from fastapi.responses import FileResponse, Response
+from sqlalchemy import insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..models.database import get_session
-from ..models.orm import GenerationORM, SessionORM
+from ..models.orm import GENERATION_BY_ID, GenerationORM, SessionORM
 from ..models.schemas import (
     BatchGenerationRequest,
     BatchGenerationResponse,
@@ -29,6 +32,10 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/generate", tags=["generation"])
 
+# A generation's image and thumbnail never change once written, so clients may
+# cache them indefinitely; the ETag lets revalidation skip the DB and disk.
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
 
 @router.post("", response_model=GenerationResponse)
 async def generate_image(
@@ -38,8 +45,7 @@ async def generate_image(
 ):
     """Queue a single image generation."""
     # Verify session exists
-    result = await db.execute(select(SessionORM).where(SessionORM.id == req.session_id))
-    session = result.scalar_one_or_none()
+    session = await db.get(SessionORM, req.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
@@ -67,6 +73,20 @@ async def generate_image(
         has_loras=len(req.loras) > 0,
     )
 
+    # img2img: find the source image on disk before any record is created,
+    # so a missing file is a plain 404
+    source_path = None
+    if req.source_image_id:
+        source_gen = await db.execute(
+            GENERATION_BY_ID, {"gid": req.source_image_id}
+        )
+        source = source_gen.scalar_one_or_none()
+        if source and source.image_path:
+            try:
+                source_path = await asyncio.to_thread(image_store.resolve_path, source.image_path)
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="Source image not found")
+
     # Create generation record
     generation_id = str(uuid.uuid4())
     gen_record = GenerationORM(
@@ -120,31 +140,42 @@ async def generate_image(
     }
 
     # Handle img2img: upload source image to ComfyUI
-    if req.source_image_id:
-        source_gen = await db.execute(
-            select(GenerationORM).where(GenerationORM.id == req.source_image_id)
-        )
-        source = source_gen.scalar_one_or_none()
-        if source and source.image_path:
-            source_bytes = await image_store.get_image(source.image_path)
-            client = client_pool.get_client(gpu_node.id)
+    if source_path is not None:
+        client = client_pool.get_client(gpu_node.id)
+        try:
+            source_file = await asyncio.to_thread(open, source_path, "rb")
+        except FileNotFoundError:
+            # Deleted since the check above; don't leave the row queued
+            await db.execute(
+                update(GenerationORM)
+                .where(GenerationORM.id == generation_id)
+                .values(status="error", error_message="Source image not found")
+            )
+            await db.commit()
+            raise HTTPException(status_code=404, detail="Source image not found")
+        # Hand httpx the open file so the multipart body is streamed in
+        # chunks rather than held in memory
+        with source_file:
             upload_result = await client.upload_image(
-                source_bytes, f"{generation_id}_source.png"
+                source_file, f"{generation_id}_source.png"
             )
-            params["source_image_filename"] = upload_result.get("name", f"{generation_id}_source.png")
+        params["source_image_filename"] = upload_result.get("name", f"{generation_id}_source.png")
 
     workflow = workflow_engine.build_workflow(template_name, params, gpu_node)
 
-    # Submit to ComfyUI in background
-    asyncio.create_task(
-        _run_generation(
+    # Submit to ComfyUI via the GPU's worker queue
+    await request.app.state.generation_dispatcher.submit(
+        gpu_node.id,
+        partial(
+            _run_generation,
             generation_id, req.session_id, session.current_stage,
-            gpu_node.id, workflow,
+            gen_record.seed, gpu_node.id, workflow,
             request.app,
-        )
+        ),
+        on_drop=partial(_drop_generation, generation_id, request.app),
     )
 
-    return GenerationResponse(
+    return GenerationResponse.model_construct(
         id=generation_id,
         session_id=req.session_id,
         status="queued",
@@ -160,8 +191,7 @@ async def generate_batch(
 ):
     """Queue a batch of image generations distributed across GPUs."""
     # Verify session
-    result = await db.execute(select(SessionORM).where(SessionORM.id == req.session_id))
-    session = result.scalar_one_or_none()
+    session = await db.get(SessionORM, req.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
@@ -247,92 +277,131 @@ async def generate_batch(
     batch_id = str(uuid.uuid4())
 
     # Generate seed sequence
-    base_seed = req.seed_start if req.seed_start != -1 else random.randint(0, 2**32 - 1)
+    base_seed = req.seed_start if req.seed_start != -1 else random.getrandbits(32)
 
     gpu_assignments = {node.id: count for node, count in assignments}
 
-    # Assign checkpoints to each generation index
-    checkpoint_assignments = []
-    for checkpoint, count in checkpoint_distribution.items():
-        checkpoint_assignments.extend([checkpoint] * count)
+    # Assign checkpoints to each generation index, in distribution order
+    checkpoint_iter = chain.from_iterable(
+        repeat(checkpoint, count) for checkpoint, count in checkpoint_distribution.items()
+    )
+
+    # Every record in the batch shares one creation timestamp
+    created_at = datetime.now(timezone.utc)
+
+    # Generation rows are collected here and inserted in one statement
+    gen_rows: list[dict] = []
+    jobs: list[tuple[str, partial, partial]] = []
+
+    # Batch-invariant inputs, computed once rather than per generation
+    workflow_engine = request.app.state.workflow_engine
+    template_name = workflow_engine.select_template(
+        req.model_family.value, is_img2img=False, has_loras=len(req.loras) > 0
+    )
+    # Determine LoRAs: use specified LoRAs or discovered LoRAs
+    loras_to_use = [l.model_dump() for l in req.loras] if req.loras else discovered_loras
+    base_params = {
+        "prompt": req.prompt,
+        "negative_prompt": req.negative_prompt,
+        "model_family": req.model_family.value,
+        "width": req.width,
+        "height": req.height,
+        "steps": req.steps,
+        "cfg_scale": req.cfg_scale,
+        "denoise_strength": 1.0,
+        "sampler": req.sampler,
+        "scheduler": req.scheduler,
+        "loras": loras_to_use,
+    }
+
+    # Workflows are built once per (GPU, checkpoint) and patched per item
+    workflow_bases: dict[tuple[str, str | None], tuple | None] = {}
+
+    total_items = sum(count for _, count in assignments)
+    generation_ids = _uuid4_strings(total_items)
+    seeds = range(base_seed, base_seed + total_items)
 
     # Create individual generation tasks
     index = 0
     for gpu_node, count in assignments:
         for i in range(count):
-            seed = base_seed + index
-            generation_id = str(uuid.uuid4())
+            seed = seeds[index]
+            generation_id = generation_ids[index]
 
             # Get checkpoint for this generation
-            assigned_checkpoint = checkpoint_assignments[index] if index < len(checkpoint_assignments) else req.checkpoint
-
-            # Determine LoRAs: use discovered LoRAs or specified LoRAs
-            loras_to_use = req.loras if req.loras else discovered_loras
-
-            gen_record = GenerationORM(
-                id=generation_id,
-                session_id=req.session_id,
-                stage=session.current_stage,
-                batch_id=batch_id,
-                batch_index=index,
-                prompt=req.prompt,
-                negative_prompt=req.negative_prompt,
-                model_family=req.model_family.value,
-                checkpoint=assigned_checkpoint,
-                task_type=req.task_type.value,
-                loras=[l if isinstance(l, dict) else l for l in loras_to_use],
-                gpu_id=gpu_node.id,
-                seed=seed,
-                width=req.width,
-                height=req.height,
-                steps=req.steps,
-                cfg_scale=req.cfg_scale,
-                denoise_strength=1.0,
-                status="queued",
-                created_at=datetime.now(timezone.utc),
-            )
-            db.add(gen_record)
-
-            # Build workflow for this specific generation
-            params = {
+            assigned_checkpoint = next(checkpoint_iter, req.checkpoint)
+
+            gen_rows.append({
+                "id": generation_id,
+                "session_id": req.session_id,
+                "stage": session.current_stage,
+                "batch_id": batch_id,
+                "batch_index": index,
                 "prompt": req.prompt,
                 "negative_prompt": req.negative_prompt,
                 "model_family": req.model_family.value,
                 "checkpoint": assigned_checkpoint,
+                "task_type": req.task_type.value,
+                "loras": loras_to_use,
+                "gpu_id": gpu_node.id,
+                "seed": seed,
                 "width": req.width,
                 "height": req.height,
                 "steps": req.steps,
                 "cfg_scale": req.cfg_scale,
                 "denoise_strength": 1.0,
-                "sampler": req.sampler,
-                "scheduler": req.scheduler,
-                "seed": seed,
-                "filename_prefix": f"imgen_{req.session_id}_{generation_id}",
-                "loras": [l if isinstance(l, dict) else l for l in loras_to_use],
-            }
+                "status": "queued",
+                "created_at": created_at,
+            })
 
-            workflow_engine = request.app.state.workflow_engine
-            template_name = workflow_engine.select_template(
-                req.model_family.value, is_img2img=False, has_loras=len(req.loras) > 0
-            )
-            workflow = workflow_engine.build_workflow(template_name, params, gpu_node)
-
-            # Launch each generation as a background task
-            asyncio.create_task(
-                _run_generation(
-                    generation_id, req.session_id, session.current_stage,
-                    gpu_node.id, workflow,
-                    request.app,
-                    batch_id=batch_id,
-                    batch_index=index,
-                    batch_total=req.count,
+            # Build workflow for this specific generation
+            params = base_params.copy()
+            params["checkpoint"] = assigned_checkpoint
+            params["seed"] = seed
+            params["filename_prefix"] = f"imgen_{req.session_id}_{generation_id}"
+
+            base_key = (gpu_node.id, assigned_checkpoint)
+            if base_key not in workflow_bases:
+                workflow_bases[base_key] = workflow_engine.build_workflow_base(
+                    template_name, params, gpu_node
                 )
-            )
+            workflow_base = workflow_bases[base_key]
+            if workflow_base is None:
+                workflow = workflow_engine.build_workflow(template_name, params, gpu_node)
+            else:
+                workflow = workflow_engine.patch_workflow(*workflow_base, {
+                    "seed": seed,
+                    "filename_prefix": params["filename_prefix"],
+                })
+
+            jobs.append((gpu_node.id, partial(
+                _run_generation,
+                generation_id, req.session_id, session.current_stage,
+                seed, gpu_node.id, workflow,
+                request.app,
+                batch_id=batch_id,
+                batch_index=index,
+                batch_total=req.count,
+            ), partial(_drop_generation, generation_id, request.app, batch_id=batch_id)))
             index += 1
 
+    # One executemany INSERT for the whole batch instead of a flush per record
+    await db.execute(insert(GenerationORM), gen_rows)
     await db.commit()
 
-    return BatchGenerationResponse(
+    request.app.state.batch_counters[batch_id] = {
+        "completed": 0,
+        "failed": 0,
+        "total": len(jobs),
+    }
+
+    # Hand the jobs to the per-GPU workers only once the rows exist; put()
+    # waits when a GPU's queue is full, pushing back on oversized batches
+    dispatcher = request.app.state.generation_dispatcher
+    for gpu_id, job, on_drop in jobs:
+        await dispatcher.submit(gpu_id, job, on_drop=on_drop)
+
+    return BatchGenerationResponse.model_construct(
         batch_id=batch_id,
         session_id=req.session_id,
         total_count=req.count,
@@ -347,13 +416,13 @@ async def get_generation(
 ):
     """Get details of a single generation."""
     result = await db.execute(
-        select(GenerationORM).where(GenerationORM.id == generation_id)
+        GENERATION_BY_ID, {"gid": generation_id}
     )
     gen = result.scalar_one_or_none()
     if not gen:
         raise HTTPException(status_code=404, detail="Generation not found")
 
-    return GenerationResultResponse(
+    return GenerationResultResponse.model_construct(
         id=gen.id,
         session_id=gen.session_id,
         stage=gen.stage,
@@ -377,15 +446,13 @@ async def get_generation_image(
 ):
     """Get the full-size generated image."""
     result = await db.execute(
-        select(GenerationORM).where(GenerationORM.id == generation_id)
+        GENERATION_BY_ID, {"gid": generation_id}
     )
     gen = result.scalar_one_or_none()
     if not gen or not gen.image_path:
         raise HTTPException(status_code=404, detail="Image not found")
 
-    image_store = request.app.state.image_store
-    image_bytes = await image_store.get_image(gen.image_path)
-    return Response(content=image_bytes, media_type="image/png")
+    return _image_file_response(request, gen.image_path, f'"{gen.id}"', "Image not found")
 
 
 @router.get("/{generation_id}/thumbnail")
@@ -396,15 +463,45 @@ async def get_generation_thumbnail(
 ):
     """Get the thumbnail of a generated image."""
     result = await db.execute(
-        select(GenerationORM).where(GenerationORM.id == generation_id)
+        GENERATION_BY_ID, {"gid": generation_id}
     )
     gen = result.scalar_one_or_none()
     if not gen or not gen.thumbnail_path:
         raise HTTPException(status_code=404, detail="Thumbnail not found")
 
-    image_store = request.app.state.image_store
-    image_bytes = await image_store.get_image(gen.thumbnail_path)
-    return Response(content=image_bytes, media_type="image/jpeg")
+    return _image_file_response(
+        request, gen.thumbnail_path, f'"{gen.id}-thumb"', "Thumbnail not found"
+    )
+
+
+def _uuid4_strings(n: int) -> list[str]:
+    """n random (version 4) UUID strings drawn from a single os.urandom() call."""
+    rand = os.urandom(16 * n)
+    return [str(uuid.UUID(bytes=rand[i:i + 16], version=4)) for i in range(0, 16 * n, 16)]
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL})
+
+
+def _image_file_response(request: Request, relative_path: str, etag: str, missing: str) -> Response:
+    """
+    Stream a stored image straight from disk (sendfile where available), or
+    answer 304 if the client's If-None-Match matches.
+
+    The conditional check comes after the row and file are found, so a
+    stale ETag for a deleted generation gets 404 rather than 304.
+
+    The media type is inferred from the file name, since a thumbnail falls
+    back to the full PNG when it could not be generated.
+    """
+    try:
+        path = request.app.state.image_store.resolve_path(relative_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=missing)
+    if request.headers.get("if-none-match") == etag:
+        return _not_modified(etag)
+    return FileResponse(path, headers={"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL})
 
 
 # --- Background task ---
@@ -413,6 +510,7 @@ async def _run_generation(
     generation_id: str,
     session_id: str,
     stage: int,
+    seed: int,
     gpu_id: str,
     workflow: dict,
     app,
@@ -425,136 +523,159 @@ async def _run_generation(
     fetch images, save to disk, update DB.
     """
     client_pool = app.state.client_pool
-    gpu_registry = app.state.gpu_registry
     image_store = app.state.image_store
     aggregator = app.state.progress_aggregator
 
     client = client_pool.get_client(gpu_id)
-    gpu_registry.increment_load(gpu_id)
-
-    try:
-        # Submit to ComfyUI
-        start_time = time.monotonic()
-        prompt_id = await client.queue_prompt(workflow)
-
-        # Register for progress tracking
-        aggregator.register_prompt(prompt_id, session_id, generation_id, gpu_id)
-
-        # Update DB status
-        async with app.state.db_session() as db:
-            result = await db.execute(
-                select(GenerationORM).where(GenerationORM.id == generation_id)
+    prompt_id: str | None = None
+
+    # One session for the generation's whole lifecycle. Each commit hands the
+    # connection back to the pool, so none is held during the ComfyUI wait.
+    async with app.state.db_session() as db:
+        try:
+            # Submit to ComfyUI
+            start_time = time.monotonic()
+            prompt_id = await client.queue_prompt(workflow)
+
+            # Register for progress tracking
+            aggregator.register_prompt(prompt_id, session_id, generation_id, gpu_id)
+
+            # Update DB status
+            await db.execute(
+                update(GenerationORM)
+                .where(GenerationORM.id == generation_id)
+                .values(status="generating", prompt_comfy_id=prompt_id)
             )
-            gen = result.scalar_one_or_none()
-            if gen:
-                gen.status = "generating"
-                gen.prompt_comfy_id = prompt_id
-                await db.commit()
-
-        # Wait for completion
-        history = await client.poll_until_complete(prompt_id, timeout=300.0)
-        elapsed_ms = int((time.monotonic() - start_time) * 1000)
-
-        # Fetch output images
-        images = await client.get_output_images(history)
-        if not images:
-            raise Exception("No images in ComfyUI output")
-
-        # Save first output image
-        filename, img_bytes = images[0]
-        image_path, thumb_path = await image_store.save_image(
-            session_id, stage, generation_id, img_bytes
-        )
-
-        # Update DB with results
-        async with app.state.db_session() as db:
-            result = await db.execute(
-                select(GenerationORM).where(GenerationORM.id == generation_id)
-            )
-            gen = result.scalar_one_or_none()
-            if gen:
-                gen.status = "complete"
-                gen.image_path = image_path
-                gen.thumbnail_path = thumb_path
-                gen.generation_time_ms = elapsed_ms
-                await db.commit()
-
-        # Send completion event to frontend
-        complete_msg = {
-            "type": "generation_complete",
-            "generationId": generation_id,
-            "imageUrl": f"/api/generate/{generation_id}/image",
-            "thumbnailUrl": f"/api/generate/{generation_id}/thumbnail",
-            "seed": gen.seed if gen else 0,
-            "generationTimeMs": elapsed_ms,
-            "gpuId": gpu_id,
-            "stage": gen.stage if gen else 0,
-        }
-
-        if batch_id is not None:
-            # Count completed in this batch
-            async with app.state.db_session() as db:
-                from sqlalchemy import func
-                result = await db.execute(
-                    select(func.count()).where(
-                        GenerationORM.batch_id == batch_id,
-                        GenerationORM.status == "complete",
-                    )
+            await db.commit()
+
+            # Wait for completion
+            history = await client.wait_until_complete(prompt_id, timeout=300.0)
+            elapsed_ms = int((time.monotonic() - start_time) * 1000)
+
+            # Stream the first output image straight into the image store
+            first_image = next(client.iter_output_images(history), None)
+            if first_image is None:
+                raise Exception("No images in ComfyUI output")
+
+            filename, subfolder, img_type = first_image
+            image_file = await image_store.prepare_image_path(session_id, stage, generation_id)
+            await client.stream_image_to(filename, image_file, subfolder, img_type)
+            image_path, thumb_path = await image_store.save_image_file(image_file)
+
+            # Update DB with results
+            await db.execute(
+                update(GenerationORM)
+                .where(GenerationORM.id == generation_id)
+                .values(
+                    status="complete",
+                    image_path=image_path,
+                    thumbnail_path=thumb_path,
+                    generation_time_ms=elapsed_ms,
                 )
-                completed = result.scalar() or 0
+            )
+            await db.commit()
 
+            # Send completion event to frontend
             complete_msg = {
-                "type": "batch_progress",
-                "batchId": batch_id,
-                "completed": completed,
-                "total": batch_total or 0,
-                "latestResult": {
-                    "generationId": generation_id,
-                    "imageUrl": f"/api/generate/{generation_id}/image",
-                    "thumbnailUrl": f"/api/generate/{generation_id}/thumbnail",
-                    "index": batch_index or 0,
-                    "stage": gen.stage if gen else 0,
-                },
+                "type": "generation_complete",
+                "generationId": generation_id,
+                "imageUrl": f"/api/generate/{generation_id}/image",
+                "thumbnailUrl": f"/api/generate/{generation_id}/thumbnail",
+                "seed": seed,
+                "generationTimeMs": elapsed_ms,
+                "gpuId": gpu_id,
+                "stage": stage,
             }
 
-            if completed >= (batch_total or 0):
-                # Also send batch_complete
-                await aggregator._send_to_session(session_id, complete_msg)
+            if batch_id is not None:
+                # Count completed in this batch. All of a batch's jobs run in this
+                # process, and the read-modify-write has no await, so a plain
+                # counter stays exact without a lock or a COUNT query.
+                counter = _finish_batch_item(app, batch_id, failed=False)
+                completed = counter["completed"] if counter else 0
+
                 complete_msg = {
-                    "type": "batch_complete",
+                    "type": "batch_progress",
                     "batchId": batch_id,
+                    "completed": completed,
                     "total": batch_total or 0,
-                    "totalTimeMs": elapsed_ms,  # approximate
+                    "latestResult": {
+                        "generationId": generation_id,
+                        "imageUrl": f"/api/generate/{generation_id}/image",
+                        "thumbnailUrl": f"/api/generate/{generation_id}/thumbnail",
+                        "index": batch_index or 0,
+                        "stage": stage,
+                    },
                 }
 
-        await aggregator._send_to_session(session_id, complete_msg)
+                if completed >= (batch_total or 0):
+                    # Also send batch_complete
+                    aggregator.enqueue(session_id, complete_msg)
+                    complete_msg = {
+                        "type": "batch_complete",
+                        "batchId": batch_id,
+                        "total": batch_total or 0,
+                        "totalTimeMs": elapsed_ms,  # approximate
+                    }
 
-        logger.info(
-            "Generation %s complete on %s in %dms",
-            generation_id, gpu_id, elapsed_ms,
-        )
+            aggregator.enqueue(session_id, complete_msg)
 
-    except Exception as e:
-        logger.exception("Generation %s failed on %s", generation_id, gpu_id)
+            logger.info(
+                "Generation %s complete on %s in %dms",
+                generation_id, gpu_id, elapsed_ms,
+            )
 
-        # Update DB with error
-        async with app.state.db_session() as db:
-            result = await db.execute(
-                select(GenerationORM).where(GenerationORM.id == generation_id)
+        except Exception as e:
+            logger.exception("Generation %s failed on %s", generation_id, gpu_id)
+
+            # Update DB with error (discarding any half-done statement first)
+            await db.rollback()
+            await db.execute(
+                update(GenerationORM)
+                .where(GenerationORM.id == generation_id)
+                .values(status="error", error_message=str(e))
             )
-            gen = result.scalar_one_or_none()
-            if gen:
-                gen.status = "error"
-                gen.error_message = str(e)
-                await db.commit()
-
-        # Notify frontend
-        await aggregator._send_to_session(session_id, {
-            "type": "error",
-            "generationId": generation_id,
-            "message": str(e),
-        })
-
-    finally:
-        gpu_registry.decrement_load(gpu_id)
-        aggregator.unregister_prompt(prompt_id if 'prompt_id' in dir() else "")
+            await db.commit()
+
+            if batch_id is not None:
+                _finish_batch_item(app, batch_id, failed=True)
+
+            # Notify frontend
+            aggregator.enqueue(session_id, {
+                "type": "error",
+                "generationId": generation_id,
+                "message": str(e),
+            })
+
+        finally:
+            if prompt_id is not None:
+                aggregator.unregister_prompt(prompt_id)
+
+
+async def _drop_generation(generation_id: str, app, batch_id: str | None = None) -> None:
+    """Mark a queued generation that will never run (dispatcher stopped) as failed."""
+    async with app.state.db_session() as db:
+        await db.execute(
+            update(GenerationORM)
+            .where(GenerationORM.id == generation_id)
+            .values(status="error", error_message="Cancelled: server shut down before it ran")
+        )
+        await db.commit()
+    if batch_id is not None:
+        _finish_batch_item(app, batch_id, failed=True)
+
+
+def _finish_batch_item(app, batch_id: str, failed: bool) -> dict | None:
+    """
+    Record one finished generation in the batch's in-memory counter.
+
+    The counter is dropped once every item has completed or failed; the
+    returned dict still reflects the final counts.
+    """
+    counter = app.state.batch_counters.get(batch_id)
+    if counter is None:
+        return None
+    counter["failed" if failed else "completed"] += 1
+    if counter["completed"] + counter["failed"] >= counter["total"]:
+        del app.state.batch_counters[batch_id]
+    return counter
@@ -2,30 +2,38 @@
 
 from __future__ import annotations
 
-from fastapi import APIRouter, Request
+import orjson
+from fastapi import APIRouter, HTTPException, Request, Response
 
 from ..models.schemas import GPUStatusResponse
 
 router = APIRouter(prefix="/api/gpus", tags=["gpus"])
 
+# (registry.version, encoded body) of the last status listing served
+_status_cache: tuple[int, bytes] | None = None
+
 
 @router.get("", response_model=list[GPUStatusResponse])
 async def get_gpu_status(request: Request):
     """Get status of all registered GPU nodes."""
+    global _status_cache
     registry = request.app.state.gpu_registry
-    return [
-        GPUStatusResponse(
-            id=node.id,
-            name=node.name,
-            tier=node.tier.value,
-            vram_gb=node.vram_gb,
-            healthy=node.healthy,
-            current_queue_length=node.current_queue_length,
-            capabilities=sorted(node.capabilities),
-            last_response_ms=node.last_response_ms,
-        )
-        for node in registry.get_all_nodes()
-    ]
+    if _status_cache is None or _status_cache[0] != registry.version:
+        body = orjson.dumps([
+            {
+                "id": node.id,
+                "name": node.name,
+                "tier": node.tier.value,
+                "vram_gb": node.vram_gb,
+                "healthy": node.healthy,
+                "current_queue_length": node.current_queue_length,
+                "capabilities": node.sorted_capabilities,
+                "last_response_ms": node.last_response_ms,
+            }
+            for node in registry.get_all_nodes()
+        ])
+        _status_cache = (registry.version, body)
+    return Response(content=_status_cache[1], media_type="application/json")
 
 
 @router.get("/{gpu_id}", response_model=GPUStatusResponse)
@@ -34,16 +42,15 @@ async def get_gpu_detail(gpu_id: str, request: Request):
     registry = request.app.state.gpu_registry
     node = registry.get_node(gpu_id)
     if not node:
-        from fastapi import HTTPException
         raise HTTPException(status_code=404, detail=f"GPU '{gpu_id}' not found")
 
-    return GPUStatusResponse(
+    return GPUStatusResponse.model_construct(
         id=node.id,
         name=node.name,
         tier=node.tier.value,
         vram_gb=node.vram_gb,
         healthy=node.healthy,
         current_queue_length=node.current_queue_length,
-        capabilities=sorted(node.capabilities),
+        capabilities=node.sorted_capabilities,
         last_response_ms=node.last_response_ms,
     )
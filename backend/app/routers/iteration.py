@@ -2,21 +2,45 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
+from collections import Counter
+from pathlib import Path
 from typing import List, Optional, Dict, Any
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..models.database import get_session
 from ..models.orm import GenerationORM, SessionORM
+from ..models.schemas import ResponseModel
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/iterate", tags=["iteration"])
 
+# A session together with the most recent generation of its current stage,
+# fetched in one round-trip (the generation side is NULL if there is none)
+_LAST_STAGE_GENERATION_ID = (
+    select(GenerationORM.id)
+    .where(
+        GenerationORM.session_id == SessionORM.id,
+        GenerationORM.stage == SessionORM.current_stage,
+    )
+    .order_by(GenerationORM.created_at.desc())
+    .limit(1)
+    .correlate(SessionORM)
+    .scalar_subquery()
+)
+SESSION_WITH_LAST_GENERATION = (
+    select(SessionORM, GenerationORM)
+    .outerjoin(GenerationORM, GenerationORM.id == _LAST_STAGE_GENERATION_ID)
+    .where(SessionORM.id == bindparam("sid"))
+)
+
 
 class FeedbackRequest(BaseModel):
     session_id: str
@@ -27,7 +51,7 @@ class FeedbackRequest(BaseModel):
     parameter_adjustments: Optional[Dict[str, Any]] = None
 
 
-class FeedbackResponse(BaseModel):
+class FeedbackResponse(ResponseModel):
     suggested_prompt: str
     suggested_negative: str
     suggested_parameters: Dict[str, Any]
@@ -47,7 +71,7 @@ class RefinePromptRequest(BaseModel):
     reference_image_ids: Optional[List[str]] = None
 
 
-class RefinePromptResponse(BaseModel):
+class RefinePromptResponse(ResponseModel):
     refined_prompt: str
     rationale: str
 
@@ -59,7 +83,7 @@ class RejectAllRequest(BaseModel):
     rejected_image_ids: List[str]
 
 
-class RejectAllResponse(BaseModel):
+class RejectAllResponse(ResponseModel):
     recorded: bool
     rationale: str
 
@@ -67,6 +91,7 @@ class RejectAllResponse(BaseModel):
 @router.post("", response_model=FeedbackResponse)
 async def submit_feedback(
     req: FeedbackRequest,
+    request: Request,
     db: AsyncSession = Depends(get_session),
 ):
     """
@@ -75,101 +100,96 @@ async def submit_feedback(
     Minimal stub: returns the same prompt and basic parameters.
     TODO: Integrate LLM prompt refinement pipeline.
     """
-    from ..main import app
-    from pathlib import Path
-
-    # Verify session exists and increment stage
-    result = await db.execute(select(SessionORM).where(SessionORM.id == req.session_id))
-    session = result.scalar_one_or_none()
-    if not session:
+    # Verify session exists. The latest generation of the stage being closed
+    # comes back in the same query, and the selected generations (if any) are
+    # loaded alongside it.
+    stmt = SESSION_WITH_LAST_GENERATION
+    if req.selected_image_ids:
+        stmt = stmt.options(selectinload(
+            SessionORM.generations.and_(GenerationORM.id.in_(req.selected_image_ids))
+        ))
+    result = await db.execute(stmt, {"sid": req.session_id})
+    row = result.first()
+    if not row:
         raise HTTPException(status_code=404, detail="Session not found")
+    session, last_gen = row
 
-    # Increment current_stage for next iteration
-    session.current_stage += 1
+    # Increment current_stage for next iteration. Done in SQL so concurrent
+    # feedback for the same session can't lose an increment.
+    result = await db.execute(
+        update(SessionORM)
+        .where(SessionORM.id == req.session_id)
+        .values(current_stage=SessionORM.current_stage + 1)
+        .returning(SessionORM.current_stage)
+        .execution_options(synchronize_session=False)
+    )
+    current_stage = result.scalar_one_or_none()
+    if current_stage is None:
+        raise HTTPException(status_code=404, detail="Session not found")
     await db.commit()
 
     logger.info(
         "Feedback submitted for session %s, action=%s, selected=%d, stage now %d",
         req.session_id, req.action,
         len(req.selected_image_ids or []),
-        session.current_stage,
+        current_stage,
     )
 
     # Record preferences for selected images
     if req.selected_image_ids:
-        preference_learning = app.state.preference_learning
-        vision_analysis = app.state.vision_analysis
-
-        # Get selected generations
-        result = await db.execute(
-            select(GenerationORM)
-            .where(GenerationORM.id.in_(req.selected_image_ids))
+        preference_learning = request.app.state.preference_learning
+        vision_analysis = request.app.state.vision_analysis
+
+        selected_gens = session.generations
+
+        # Selections are written for learning by the background writer; the
+        # response doesn't depend on them
+        # TODO: Parse gen.parameters for LoRA info when we start tracking it
+        await preference_learning.queue_preferences(
+            [
+                {
+                    "prompt": gen.prompt,
+                    "checkpoint": gen.checkpoint or "unknown",
+                    "loras": [],
+                    "selected": True,
+                    "rejected": False,
+                    "model_family": gen.model_family or "sdxl",
+                    "task_type": gen.task_type or "standard",
+                    "stage": current_stage - 1,
+                    "session_id": req.session_id,
+                    "generation_id": gen.id,
+                    "negative_prompt": gen.negative_prompt,
+                }
+                for gen in selected_gens
+            ],
         )
-        selected_gens = result.scalars().all()
-
-        # Record each selection for learning
-        for gen in selected_gens:
-            # Extract LoRAs from parameters if available
-            loras = []
-            # TODO: Parse gen.parameters for LoRA info when we start tracking it
-
-            # Record preference
-            await preference_learning.record_preference(
-                db=db,
-                prompt=gen.prompt,
-                checkpoint=gen.checkpoint or "unknown",
-                loras=loras,
-                selected=True,
-                rejected=False,
-                model_family=gen.model_family or "sdxl",
-                task_type=gen.task_type or "standard",
-                stage=session.current_stage - 1,
-                session_id=req.session_id,
-                generation_id=gen.id,
-                negative_prompt=gen.negative_prompt,
-            )
 
         logger.info(
-            "Recorded %d selections for preference learning",
+            "Queued %d selections for preference learning",
             len(selected_gens)
         )
 
         # EXPERIMENTAL: Vision analysis of selected images (logging only)
         if vision_analysis.enabled:
-            image_paths = []
-            for gen in selected_gens:
-                # Use image_path directly from ORM
-                if gen.image_path:
-                    img_path = Path(gen.image_path)
-                    if img_path.exists():
-                        image_paths.append(img_path)
+            image_paths = await _existing_image_paths(
+                selected_gens, request.app.state.image_store.base_dir
+            )
 
             if image_paths:
                 original_prompt = selected_gens[0].prompt if selected_gens else ""
                 # Analyze in background to not block response
-                import asyncio
-                asyncio.create_task(
+                vision_analysis.run_in_background(
                     vision_analysis.analyze_selected_images(image_paths, original_prompt)
                 )
 
     # Get the original prompt from the most recent generation in the previous stage
     # This is a temporary solution until we implement LLM prompt refinement
-    result = await db.execute(
-        select(GenerationORM)
-        .where(
-            GenerationORM.session_id == req.session_id,
-            GenerationORM.stage == session.current_stage - 1
-        )
-        .order_by(GenerationORM.created_at.desc())
-        .limit(1)
-    )
-    last_gen = result.scalar_one_or_none()
     original_prompt = last_gen.prompt if last_gen else ""
     original_negative = last_gen.negative_prompt if last_gen else ""
 
     # Stub response - echo back the original prompt
     # TODO: implement LLM prompt refinement based on selected images
-    return FeedbackResponse(
+    return FeedbackResponse.model_construct(
         suggested_prompt=original_prompt,
         suggested_negative=original_negative,
         suggested_parameters={},
@@ -195,8 +215,7 @@ async def refine_prompt(
     TODO: Integrate LLM prompt refinement.
     """
     # Verify session exists
-    result = await db.execute(select(SessionORM).where(SessionORM.id == req.session_id))
-    session = result.scalar_one_or_none()
+    session = await db.get(SessionORM, req.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
@@ -206,7 +225,7 @@ async def refine_prompt(
     )
 
     # Stub response
-    return RefinePromptResponse(
+    return RefinePromptResponse.model_construct(
         refined_prompt=req.current_prompt,
         rationale="Prompt refinement not yet implemented",
     )
@@ -215,6 +234,7 @@ async def refine_prompt(
 @router.post("/reject-all", response_model=RejectAllResponse)
 async def reject_all(
     req: RejectAllRequest,
+    request: Request,
     db: AsyncSession = Depends(get_session),
 ):
     """
@@ -223,11 +243,8 @@ async def reject_all(
     This feeds back into checkpoint/LoRA learning to avoid bad combinations.
     Likely causes: too strong LoRA, wrong checkpoint for the prompt.
     """
-    from ..main import app
-
     # Verify session exists
-    result = await db.execute(select(SessionORM).where(SessionORM.id == req.session_id))
-    session = result.scalar_one_or_none()
+    session = await db.get(SessionORM, req.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
@@ -236,82 +253,74 @@ async def reject_all(
         req.session_id, req.stage, req.feedback_text, len(req.rejected_image_ids),
     )
 
-    # Get the rejected generations to extract checkpoint/LoRA info
+    # Get the rejected generations to extract checkpoint/LoRA info. Only the
+    # columns used below are selected, as plain rows rather than ORM objects.
+    checkpoints_used: Counter[str] = Counter()
     if req.rejected_image_ids:
         result = await db.execute(
-            select(GenerationORM)
+            select(
+                GenerationORM.id,
+                GenerationORM.prompt,
+                GenerationORM.negative_prompt,
+                GenerationORM.checkpoint,
+                GenerationORM.model_family,
+                GenerationORM.image_path,
+            )
             .where(GenerationORM.id.in_(req.rejected_image_ids))
         )
-        rejected_gens = result.scalars().all()
+        rejected_gens = result.all()
 
-        # Extract checkpoints and LoRAs used
-        checkpoints_used = {}
-        loras_used = {}
-        for gen in rejected_gens:
-            checkpoint = gen.checkpoint
-            if checkpoint:
-                checkpoints_used[checkpoint] = checkpoints_used.get(checkpoint, 0) + 1
+        # Count rejections per checkpoint
+        # TODO: Extract LoRA names from gen.parameters when we start tracking them
+        checkpoints_used.update(gen.checkpoint for gen in rejected_gens if gen.checkpoint)
 
-            # TODO: Extract LoRA names from gen.parameters when we start tracking them
-            # For now, this is a placeholder for future LoRA tracking
-
-        logger.info(
-            "Rejected checkpoints: %s",
-            {k: v for k, v in checkpoints_used.items()},
-        )
+        logger.info("Rejected checkpoints: %s", dict(checkpoints_used))
 
         # Record rejections with full prompt context via PreferenceLearning
         # This is context-aware: tracks (prompt keywords + checkpoint) combinations
         # instead of globally penalizing checkpoints across all prompts.
         # A checkpoint might be bad for "anime" but great for "photorealistic",
         # so we need to track rejections in context.
-        preference_learning = app.state.preference_learning
-
-        # Record each rejection for preference learning
-        for gen in rejected_gens:
-            # Extract LoRAs from parameters if available
-            loras = []
-            # TODO: Parse gen.parameters for LoRA info
-
-            await preference_learning.record_preference(
-                db=db,
-                prompt=gen.prompt,
-                checkpoint=gen.checkpoint or "unknown",
-                loras=loras,
-                selected=False,
-                rejected=True,
-                model_family=gen.model_family or "sdxl",
-                task_type="standard",
-                stage=req.stage,
-                session_id=req.session_id,
-                generation_id=gen.id,
-                feedback_text=req.feedback_text,
-                negative_prompt=gen.negative_prompt,
-            )
+        preference_learning = request.app.state.preference_learning
+
+        # Queue all rejections for the background preference writer
+        # TODO: Parse gen.parameters for LoRA info
+        await preference_learning.queue_preferences(
+            [
+                {
+                    "prompt": gen.prompt,
+                    "checkpoint": gen.checkpoint or "unknown",
+                    "loras": [],
+                    "selected": False,
+                    "rejected": True,
+                    "model_family": gen.model_family or "sdxl",
+                    "task_type": "standard",
+                    "stage": req.stage,
+                    "session_id": req.session_id,
+                    "generation_id": gen.id,
+                    "feedback_text": req.feedback_text,
+                    "negative_prompt": gen.negative_prompt,
+                }
+                for gen in rejected_gens
+            ],
+        )
 
         logger.info(
-            "Recorded %d rejections for preference learning",
+            "Queued %d rejections for preference learning",
             len(rejected_gens)
         )
 
         # EXPERIMENTAL: Vision analysis of rejected images (logging only)
-        vision_analysis = app.state.vision_analysis
+        vision_analysis = request.app.state.vision_analysis
         if vision_analysis.enabled:
-            from pathlib import Path
-            import asyncio
-
-            image_paths = []
-            for gen in rejected_gens:
-                # Use image_path directly from ORM
-                if gen.image_path:
-                    img_path = Path(gen.image_path)
-                    if img_path.exists():
-                        image_paths.append(img_path)
+            image_paths = await _existing_image_paths(
+                rejected_gens, request.app.state.image_store.base_dir
+            )
 
             if image_paths:
                 original_prompt = rejected_gens[0].prompt if rejected_gens else ""
                 # Analyze in background
-                asyncio.create_task(
+                vision_analysis.run_in_background(
                     vision_analysis.analyze_rejected_images(
                         image_paths,
                         original_prompt,
@@ -324,7 +333,18 @@ async def reject_all(
         # - If feedback mentions "wrong style", adjust checkpoint-prompt matching
         # - Track LoRA combinations that get rejected together
 
-    return RejectAllResponse(
+    return RejectAllResponse.model_construct(
         recorded=True,
         rationale=f"Rejection recorded. Penalized {len(checkpoints_used)} checkpoint(s) in learning system.",
     )
+
+
+async def _existing_image_paths(gens, base_dir: Path) -> List[Path]:
+    """Image paths of the given generations that exist on disk.
+
+    gen.image_path is stored relative to the image store's base_dir, so each
+    path is a single join. All the stat() calls happen in one worker thread
+    rather than blocking the event loop once per image.
+    """
+    candidates = [base_dir / gen.image_path for gen in gens if gen.image_path]
+    return await asyncio.to_thread(lambda: [p for p in candidates if p.exists()])
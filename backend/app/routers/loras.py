@@ -43,6 +43,10 @@ async def search_loras(
 
     Returns list of {name, relevance, matched_keywords}
     """
+    # Nothing to match against without a prompt
+    if not prompt.strip():
+        return []
+
     lora_discovery = request.app.state.lora_discovery
 
     available_loras = lora_discovery.get_cached_loras(None)
@@ -7,6 +7,8 @@ from typing import Dict, Any, List
 
 from fastapi import APIRouter, Request, Query
 
+from ..services.model_sync import USAGE_HISTORY_SIZE
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/models", tags=["models"])
@@ -30,7 +32,7 @@ async def get_sync_status(request: Request):
 async def recommend_cache(
     request: Request,
     node_id: str = Query(..., description="GPU node ID (e.g., gpu-premium)"),
-    max_items: int = Query(10, description="Max items to recommend per type"),
+    max_items: int = Query(10, ge=0, description="Max items to recommend per type"),
 ):
     """
     Get cache recommendations for a specific node.
@@ -53,7 +55,9 @@ async def recommend_cache(
 async def get_hot_models(
     request: Request,
     days: int = Query(7, description="Number of days to look back"),
-    min_uses: int = Query(3, description="Minimum uses to be considered hot"),
+    min_uses: int = Query(
+        3, le=USAGE_HISTORY_SIZE, description="Minimum uses to be considered hot"
+    ),
 ):
     """
     Get frequently used models (cache candidates).
@@ -78,10 +82,7 @@ async def get_nas_models(request: Request):
     }
     """
     model_sync = request.app.state.model_sync
-    return {
-        "checkpoints": list(model_sync.nas_checkpoints.keys()),
-        "loras": list(model_sync.nas_loras.keys()),
-    }
+    return model_sync.nas_model_names()
 
 
 @router.get("/node-cache/{node_id}", response_model=Dict[str, Any])
@@ -109,7 +110,7 @@ async def get_node_cache(request: Request, node_id: str):
         "cached_loras": list(cache.cached_loras),
         "cache_used_mb": cache.cache_used_mb,
         "cache_capacity_mb": cache.cache_capacity_mb,
-        "last_sync": cache.last_sync.isoformat() if cache.last_sync else None,
+        "last_sync": cache.last_sync,
     }
 
 
@@ -101,6 +101,10 @@ async def recommend_loras(
 
     Returns: [{lora: str, score: float}, ...]
     """
+    # Nothing to match against without a prompt
+    if not prompt.strip():
+        return []
+
     preference_learning = request.app.state.preference_learning
     lora_discovery = request.app.state.lora_discovery
 
@@ -2,10 +2,12 @@
 
 from __future__ import annotations
 
+import asyncio
 import uuid
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from pydantic import TypeAdapter
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -13,12 +15,16 @@ from ..models.database import get_session
 from ..models.orm import GenerationORM, SessionORM
 from ..models.schemas import (
     CreateSessionRequest,
+    FlowType,
     GenerationResultResponse,
     SessionResponse,
 )
 
 router = APIRouter(prefix="/api/sessions", tags=["sessions"])
 
+# Serializes a whole generation listing in one pydantic-core pass
+_GENERATION_LIST = TypeAdapter(list[GenerationResultResponse])
+
 
 @router.post("", response_model=SessionResponse)
 async def create_session(
@@ -37,7 +43,7 @@ async def create_session(
     db.add(session)
     await db.commit()
 
-    return SessionResponse(
+    return SessionResponse.model_construct(
         id=session.id,
         flow_type=req.flow_type,
         created_at=session.created_at,
@@ -52,14 +58,13 @@ async def get_session_info(
     db: AsyncSession = Depends(get_session),
 ):
     """Get session details."""
-    result = await db.execute(select(SessionORM).where(SessionORM.id == session_id))
-    session = result.scalar_one_or_none()
+    session = await db.get(SessionORM, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    return SessionResponse(
+    return SessionResponse.model_construct(
         id=session.id,
-        flow_type=session.flow_type,
+        flow_type=FlowType(session.flow_type),
         created_at=session.created_at,
         current_stage=session.current_stage,
         config=session.config,
@@ -73,16 +78,31 @@ async def get_session_generations(
     db: AsyncSession = Depends(get_session),
 ):
     """Get all generations for a session, optionally filtered by stage."""
-    query = select(GenerationORM).where(GenerationORM.session_id == session_id)
+    # Only the columns the response needs: plain rows skip ORM instance
+    # construction and identity-map bookkeeping entirely
+    query = select(
+        GenerationORM.id,
+        GenerationORM.session_id,
+        GenerationORM.stage,
+        GenerationORM.prompt,
+        GenerationORM.negative_prompt,
+        GenerationORM.gpu_id,
+        GenerationORM.generation_time_ms,
+        GenerationORM.parameters,
+        GenerationORM.seed,
+        GenerationORM.created_at,
+    ).where(
+        GenerationORM.session_id == session_id,
+        GenerationORM.status == "complete",
+    )
     if stage is not None:
         query = query.where(GenerationORM.stage == stage)
-    query = query.order_by(GenerationORM.created_at)
-
-    result = await db.execute(query)
-    generations = result.scalars().all()
+    query = query.order_by(GenerationORM.created_at).execution_options(yield_per=100)
 
-    return [
-        GenerationResultResponse(
+    # Rows are streamed in chunks and turned into responses as they arrive
+    results = []
+    async for g in await db.stream(query):
+        results.append(GenerationResultResponse.model_construct(
             id=g.id,
             session_id=g.session_id,
             stage=g.stage,
@@ -95,10 +115,8 @@ async def get_session_generations(
             parameters=g.parameters,
             seed=g.seed,
             created_at=g.created_at,
-        )
-        for g in generations
-        if g.status == "complete"
-    ]
+        ))
+    return Response(content=_GENERATION_LIST.dump_json(results), media_type="application/json")
 
 
 @router.delete("/{session_id}")
@@ -108,20 +126,22 @@ async def delete_session(
     db: AsyncSession = Depends(get_session),
 ):
     """Delete a session and its images."""
-    result = await db.execute(select(SessionORM).where(SessionORM.id == session_id))
-    session = result.scalar_one_or_none()
+    session = await db.get(SessionORM, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    # Delete images from filesystem
-    image_store = request.app.state.image_store
-    await image_store.delete_session(session_id)
+    async def delete_rows() -> None:
+        # ON DELETE CASCADE removes generations along with the session, but
+        # databases created before the foreign key existed still need the
+        # explicit DELETE; both happen in one transaction.
+        await db.execute(
+            GenerationORM.__table__.delete().where(GenerationORM.session_id == session_id)
+        )
+        await db.delete(session)
+        await db.commit()
 
-    # Delete DB records
-    await db.execute(
-        GenerationORM.__table__.delete().where(GenerationORM.session_id == session_id)
-    )
-    await db.delete(session)
-    await db.commit()
+    # Image files and DB rows are independent, so delete them concurrently
+    image_store = request.app.state.image_store
+    await asyncio.gather(image_store.delete_session(session_id), delete_rows())
 
     return {"status": "deleted", "session_id": session_id}
@@ -3,20 +3,24 @@
 from __future__ import annotations
 
 import logging
+import time
 from typing import List, Dict, Optional
-from collections import defaultdict
+from collections import Counter
 
 logger = logging.getLogger(__name__)
 
+# The UI polls the stats summary; it only changes when a result is recorded.
+STATS_SUMMARY_TTL = 2.0
+
 
 class CheckpointLearning:
     """Track checkpoint performance and suggest optimal checkpoints."""
 
     def __init__(self):
-        # Track selection rates: checkpoint -> {selected: int, total: int}
-        self.checkpoint_stats: Dict[str, Dict[str, int]] = defaultdict(
-            lambda: {"selected": 0, "total": 0}
-        )
+        # Track selection rates: checkpoint -> count. Reading an unseen
+        # checkpoint returns 0 without adding an entry.
+        self.selected: Counter[str] = Counter()
+        self.total: Counter[str] = Counter()
 
         # Checkpoint pools for different tiers
         self.checkpoint_pools = {
@@ -32,6 +36,10 @@ class CheckpointLearning:
             ],
         }
 
+        # Cached get_stats_summary() result and when it was built (monotonic)
+        self._summary_cache: Optional[Dict[str, Dict[str, any]]] = None
+        self._summary_built_at = 0.0
+
     def get_checkpoints_for_tier(
         self,
         model_family: str,
@@ -65,35 +73,31 @@ class CheckpointLearning:
 
     def _get_best_checkpoint(self, pool: List[str]) -> str:
         """Get the best performing checkpoint from a pool."""
-        best = None
-        best_rate = 0.0
-
-        for checkpoint in pool:
-            stats = self.checkpoint_stats[checkpoint]
-            if stats["total"] == 0:
-                continue
-
-            rate = stats["selected"] / stats["total"]
-            if rate > best_rate:
-                best_rate = rate
-                best = checkpoint
+        # Selection rate of every checkpoint that has stats; max() keeps the
+        # first of equally good ones
+        rates = {
+            checkpoint: self.selected[checkpoint] / total
+            for checkpoint in pool
+            if (total := self.total[checkpoint])
+        }
+        best = max(rates, key=rates.__getitem__, default=None)
 
-        # If no stats yet, return first in pool
-        return best or pool[0]
+        # If no stats yet (or nothing ever selected), return first in pool
+        return best if best is not None and rates[best] > 0 else pool[0]
 
     def record_generation(self, checkpoint: str, selected: bool = False):
         """Record a generation result for learning."""
-        stats = self.checkpoint_stats[checkpoint]
-        stats["total"] += 1
+        self.total[checkpoint] += 1
         if selected:
-            stats["selected"] += 1
+            self.selected[checkpoint] += 1
+        self._summary_cache = None
 
         logger.debug(
             "Checkpoint %s: %d/%d selected (%.1f%%)",
             checkpoint,
-            stats["selected"],
-            stats["total"],
-            (stats["selected"] / stats["total"]) * 100 if stats["total"] > 0 else 0
+            self.selected[checkpoint],
+            self.total[checkpoint],
+            (self.selected[checkpoint] / self.total[checkpoint]) * 100,
         )
 
     def record_rejection(self, checkpoint: str, count: int = 1):
@@ -103,27 +107,45 @@ class CheckpointLearning:
         When all images in a batch are rejected, this signals the checkpoint
         may not be suitable for that prompt/style.
         """
-        stats = self.checkpoint_stats[checkpoint]
-        stats["total"] += count
-        # Rejections don't increment selected, lowering the selection rate
-
-        logger.info(
-            "Checkpoint %s rejected %d times, selection rate: %.1f%%",
-            checkpoint,
-            count,
-            (stats["selected"] / stats["total"]) * 100 if stats["total"] > 0 else 0
-        )
+        self.record_rejections({checkpoint: count})
+
+    def record_rejections(self, counts: Dict[str, int]):
+        """Record rejections for several checkpoints at once ({checkpoint: count})."""
+        for checkpoint, count in counts.items():
+            self.total[checkpoint] += count
+            # Rejections don't increment selected, lowering the selection rate
+
+            total = self.total[checkpoint]
+            logger.info(
+                "Checkpoint %s rejected %d times, selection rate: %.1f%%",
+                checkpoint,
+                count,
+                (self.selected[checkpoint] / total) * 100 if total > 0 else 0
+            )
+        self._summary_cache = None
 
     def get_stats_summary(self) -> Dict[str, Dict[str, any]]:
-        """Get summary of checkpoint performance."""
+        """
+        Get summary of checkpoint performance.
+
+        Cached for STATS_SUMMARY_TTL seconds; recording a result invalidates it.
+        """
+        now = time.monotonic()
+        if self._summary_cache is not None and now - self._summary_built_at < STATS_SUMMARY_TTL:
+            return self._summary_cache
+
         summary = {}
-        for checkpoint, stats in self.checkpoint_stats.items():
-            if stats["total"] > 0:
+        for checkpoint, total in self.total.items():
+            if total > 0:
+                selected = self.selected[checkpoint]
                 summary[checkpoint] = {
-                    "selected": stats["selected"],
-                    "total": stats["total"],
-                    "selection_rate": stats["selected"] / stats["total"],
+                    "selected": selected,
+                    "total": total,
+                    "selection_rate": selected / total,
                 }
+
+        self._summary_cache = summary
+        self._summary_built_at = now
         return summary
 
     def distribute_batch_across_checkpoints(
@@ -136,18 +158,10 @@ class CheckpointLearning:
 
         Returns: {checkpoint: count} mapping
         """
-        if len(checkpoints) == 1:
-            return {checkpoints[0]: total_count}
-
-        # Distribute evenly, with remainder going to best checkpoint
-        base_count = total_count // len(checkpoints)
-        remainder = total_count % len(checkpoints)
-
-        distribution = {}
-        for i, checkpoint in enumerate(checkpoints):
-            count = base_count
-            if i == 0:  # Give remainder to first (best) checkpoint
-                count += remainder
-            distribution[checkpoint] = count
-
-        return distribution
+        # Distribute evenly; the remainder goes one each to the first (best)
+        # checkpoints rather than all to the top one
+        base_count, remainder = divmod(total_count, len(checkpoints))
+        return {
+            checkpoint: base_count + (i < remainder)
+            for i, checkpoint in enumerate(checkpoints)
+        }
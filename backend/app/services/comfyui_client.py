@@ -11,14 +11,19 @@ import asyncio
 import logging
 import time
 import uuid
-from typing import AsyncGenerator
+from pathlib import Path
+from typing import AsyncGenerator, BinaryIO, Iterator
 
 import httpx
+import orjson
 
 from .gpu_registry import GPUNode, GPURegistry
 
 logger = logging.getLogger(__name__)
 
+# Chunk size for streaming image downloads to disk
+DOWNLOAD_CHUNK_SIZE = 65536
+
 
 class ComfyUIError(Exception):
     """Error from ComfyUI API."""
@@ -34,9 +39,22 @@ class ComfyUIClient:
     def __init__(self, node: GPUNode) -> None:
         self.node = node
         self.client_id = str(uuid.uuid4())
+        # prompt_id -> future resolved when ComfyUI reports the prompt finished
+        self._completions: dict[str, asyncio.Future[None]] = {}
+        # Keep idle connections well past the fallback history poll interval
+        # (httpx's default expiry is 5s) so polls and downloads reuse sockets;
+        # retries=1 re-attempts only failed connects, never a sent request.
         self.http = httpx.AsyncClient(
             base_url=node.base_url,
             timeout=httpx.Timeout(30.0, connect=10.0),
+            transport=httpx.AsyncHTTPTransport(
+                retries=1,
+                limits=httpx.Limits(
+                    max_connections=32,
+                    max_keepalive_connections=16,
+                    keepalive_expiry=60.0,
+                ),
+            ),
         )
 
     @property
@@ -52,7 +70,12 @@ class ComfyUIClient:
             "prompt": workflow,
             "client_id": self.client_id,
         }
-        resp = await self.http.post("/prompt", json=payload)
+        # orjson is much faster than httpx's stdlib json for large workflow graphs
+        resp = await self.http.post(
+            "/prompt",
+            content=orjson.dumps(payload),
+            headers={"Content-Type": "application/json"},
+        )
 
         if resp.status_code != 200:
             error_text = resp.text
@@ -85,21 +108,37 @@ class ComfyUIClient:
         data = resp.json()
         return data.get(prompt_id)
 
-    async def get_image(
+    async def stream_image_to(
         self,
         filename: str,
+        dest_path: Path,
         subfolder: str = "",
         folder_type: str = "output",
-    ) -> bytes:
-        """Download a generated image from ComfyUI."""
+    ) -> None:
+        """
+        Download a generated image from ComfyUI straight into dest_path.
+
+        The body is written chunk by chunk as it arrives, so the image is
+        never held in memory whole; file I/O runs in worker threads to keep
+        disk latency off the event loop. A partial file is removed on failure.
+        """
         params = {
             "filename": filename,
             "subfolder": subfolder,
             "type": folder_type,
         }
-        resp = await self.http.get("/view", params=params)
-        resp.raise_for_status()
-        return resp.content
+        try:
+            async with self.http.stream("GET", "/view", params=params) as resp:
+                resp.raise_for_status()
+                f = await asyncio.to_thread(open, dest_path, "wb")
+                try:
+                    async for chunk in resp.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        await asyncio.to_thread(f.write, chunk)
+                finally:
+                    await asyncio.to_thread(f.close)
+        except BaseException:
+            dest_path.unlink(missing_ok=True)
+            raise
 
     async def get_object_info(self) -> dict:
         """
@@ -112,7 +151,7 @@ class ComfyUIClient:
 
     async def upload_image(
         self,
-        image_bytes: bytes,
+        image: bytes | BinaryIO,
         filename: str,
         subfolder: str = "",
         image_type: str = "input",
@@ -120,9 +159,12 @@ class ComfyUIClient:
     ) -> dict:
         """
         Upload an image to ComfyUI (for img2img workflows).
+
+        `image` may be raw bytes or a binary file object, which httpx streams
+        in chunks instead of loading it whole.
         Returns {"name": filename, "subfolder": subfolder, "type": image_type}.
         """
-        files = {"image": (filename, image_bytes, "image/png")}
+        files = {"image": (filename, image, "image/png")}
         data = {
             "subfolder": subfolder,
             "type": image_type,
@@ -132,44 +174,75 @@ class ComfyUIClient:
         resp.raise_for_status()
         return resp.json()
 
-    async def poll_until_complete(
+    def notify_prompt_finished(self, prompt_id: str) -> None:
+        """
+        Called by the WebSocket listener when ComfyUI reports that a prompt
+        submitted by this client has finished executing (successfully or not).
+        Its history entry is written by then.
+        """
+        future = self._completions.get(prompt_id)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    async def wait_until_complete(
         self,
         prompt_id: str,
         timeout: float = 300.0,
-        poll_interval: float = 1.0,
+        fallback_poll_interval: float = 5.0,
     ) -> dict:
         """
-        Poll history endpoint until the prompt completes.
-        Returns the history entry with outputs.
-        Raises TimeoutError if not complete within timeout.
+        Wait for a prompt to complete and return its history entry with outputs.
+
+        Completion is pushed over ComfyUI's WebSocket (see
+        notify_prompt_finished), so normally the history is fetched just once
+        after the event. The history is also checked up front and every
+        fallback_poll_interval seconds, which covers an event missed while
+        the WebSocket was reconnecting or one sent before we started waiting.
+        Raises ComfyUIError if the prompt finished without outputs, and
+        TimeoutError if it doesn't finish within timeout.
         """
-        start = time.monotonic()
-        while (time.monotonic() - start) < timeout:
-            history = await self.get_history(prompt_id)
-            if history and history.get("outputs"):
-                return history
-            await asyncio.sleep(poll_interval)
-
-        raise TimeoutError(
-            f"Prompt {prompt_id} on {self.gpu_id} did not complete within {timeout}s"
+        future = self._completions.setdefault(
+            prompt_id, asyncio.get_running_loop().create_future()
         )
-
-    async def get_output_images(self, history: dict) -> list[tuple[str, bytes]]:
-        """
-        Extract and download all output images from a history entry.
-        Returns list of (filename, image_bytes) tuples.
-        """
-        images = []
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                finished = future.done()
+                history = await self.get_history(prompt_id)
+                if history and history.get("outputs"):
+                    return history
+                if finished:
+                    raise ComfyUIError(
+                        f"Prompt {prompt_id} on {self.gpu_id} finished without outputs: "
+                        f"{(history or {}).get('status')}"
+                    )
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"Prompt {prompt_id} on {self.gpu_id} did not complete within {timeout}s"
+                    )
+                try:
+                    await asyncio.wait_for(
+                        asyncio.shield(future), min(fallback_poll_interval, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._completions.pop(prompt_id, None)
+
+    @staticmethod
+    def iter_output_images(history: dict) -> Iterator[tuple[str, str, str]]:
+        """Yield (filename, subfolder, type) for each output image in a history entry."""
         outputs = history.get("outputs", {})
         for node_id, node_output in outputs.items():
             if "images" in node_output:
                 for img_info in node_output["images"]:
-                    filename = img_info["filename"]
-                    subfolder = img_info.get("subfolder", "")
-                    img_type = img_info.get("type", "output")
-                    img_bytes = await self.get_image(filename, subfolder, img_type)
-                    images.append((filename, img_bytes))
-        return images
+                    yield (
+                        img_info["filename"],
+                        img_info.get("subfolder", ""),
+                        img_info.get("type", "output"),
+                    )
 
     async def close(self) -> None:
         """Close the HTTP client."""
@@ -0,0 +1,114 @@
+"""
+Generation Dispatcher - bounded per-GPU work queues for background generations.
+
+Instead of spawning one task per image, jobs are put on the queue of the GPU
+they were routed to and drained by a fixed number of workers per GPU. A
+freed worker picks up the next job immediately, and a full queue applies
+backpressure to the submitting request instead of flooding ComfyUI.
+
+A job counts toward its GPU's load from submission until it finishes, so
+routing sees work still waiting in the queue as well as work on the GPU.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from .gpu_registry import GPURegistry
+
+logger = logging.getLogger(__name__)
+
+# A queued job: zero-argument callable returning the coroutine to run
+Job = Callable[[], Awaitable[None]]
+
+DEFAULT_MAX_QUEUE_DEPTH = 256
+
+
+class GenerationDispatcher:
+    """Per-GPU asyncio.Queue instances drained by max_concurrency workers each."""
+
+    def __init__(self, max_queue_depth: int = DEFAULT_MAX_QUEUE_DEPTH) -> None:
+        self.max_queue_depth = max_queue_depth
+        self._registry: GPURegistry | None = None
+        # Each entry is (job, on_drop); on_drop runs if the job never starts
+        self._queues: dict[str, asyncio.Queue[tuple[Job, Job | None]]] = {}
+        self._workers: list[asyncio.Task] = []
+
+    def start(self, gpu_registry: GPURegistry) -> None:
+        """Create a queue and its worker pool for every registered GPU."""
+        self._registry = gpu_registry
+        for node in gpu_registry.nodes.values():
+            queue: asyncio.Queue[tuple[Job, Job | None]] = asyncio.Queue(maxsize=self.max_queue_depth)
+            self._queues[node.id] = queue
+            for i in range(max(1, node.max_concurrency)):
+                self._workers.append(asyncio.create_task(
+                    self._worker(node.id, queue), name=f"gen-worker-{node.id}-{i}",
+                ))
+            logger.info(
+                "Dispatcher: %s with %d worker(s), queue depth %d",
+                node.id, max(1, node.max_concurrency), self.max_queue_depth,
+            )
+
+    async def stop(self) -> None:
+        """
+        Cancel all workers. Jobs still waiting in the queues never run; each
+        one's on_drop callback is awaited so it can record the failure.
+        """
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+        dropped = 0
+        for gpu_id, queue in self._queues.items():
+            while not queue.empty():
+                _, on_drop = queue.get_nowait()
+                dropped += 1
+                self._job_left_queue(gpu_id)
+                self._registry.decrement_load(gpu_id)
+                if on_drop is None:
+                    continue
+                try:
+                    await on_drop()
+                except Exception:
+                    logger.exception("Error handling dropped %s generation job", gpu_id)
+        if dropped:
+            logger.warning("Dispatcher stopped with %d queued job(s) that never ran", dropped)
+        self._queues.clear()
+
+    async def submit(self, gpu_id: str, job: Job, on_drop: Job | None = None) -> None:
+        """
+        Queue a job for a GPU, waiting if that GPU's queue is full.
+
+        on_drop is called instead of the job if the dispatcher stops before
+        the job starts.
+        """
+        node = self._registry.get_node(gpu_id)
+        node.dispatch_backlog += 1
+        self._registry.increment_load(gpu_id)
+        try:
+            await self._queues[gpu_id].put((job, on_drop))
+        except BaseException:
+            self._job_left_queue(gpu_id)
+            self._registry.decrement_load(gpu_id)
+            raise
+
+    def _job_left_queue(self, gpu_id: str) -> None:
+        node = self._registry.get_node(gpu_id)
+        node.dispatch_backlog = max(0, node.dispatch_backlog - 1)
+
+    async def _worker(self, gpu_id: str, queue: asyncio.Queue[tuple[Job, Job | None]]) -> None:
+        while True:
+            job, _ = await queue.get()
+            self._job_left_queue(gpu_id)
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Unhandled error in %s generation worker", gpu_id)
+            finally:
+                self._registry.decrement_load(gpu_id)
+                queue.task_done()
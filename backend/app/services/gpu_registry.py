@@ -12,6 +12,7 @@ import logging
 import time
 from dataclasses import dataclass, field
 from enum import Enum
+from operator import attrgetter
 from pathlib import Path
 
 import httpx
@@ -35,7 +36,7 @@ TIER_ORDER: dict[Tier, int] = {
 }
 
 
-@dataclass
+@dataclass(slots=True)
 class GPUNode:
     id: str
     name: str
@@ -46,11 +47,23 @@ class GPUNode:
     capabilities: set[str]
     max_resolution: int
     max_batch: int
+    # Generations kept in flight on this node by the dispatcher
+    max_concurrency: int = 2
     # Runtime state
     current_queue_length: int = 0
+    # Jobs waiting in the dispatcher's queue for this node; ComfyUI doesn't
+    # see them yet, so health checks add them to its reported queue
+    dispatch_backlog: int = 0
     healthy: bool = False
     last_health_check: float = 0.0
     last_response_ms: float = 0.0
+    # Capabilities and tier never change after load, so these are computed once
+    sorted_capabilities: list[str] = field(init=False, repr=False, default_factory=list)
+    tier_rank: int = field(init=False, repr=False, default=0)
+
+    def __post_init__(self) -> None:
+        self.sorted_capabilities = sorted(self.capabilities)
+        self.tier_rank = TIER_ORDER[self.tier]
 
     @property
     def base_url(self) -> str:
@@ -60,10 +73,6 @@ class GPUNode:
     def ws_url(self) -> str:
         return f"ws://{self.host}:{self.port}/ws"
 
-    @property
-    def tier_rank(self) -> int:
-        return TIER_ORDER[self.tier]
-
 
 class GPURegistry:
     """
@@ -74,6 +83,32 @@ class GPURegistry:
     def __init__(self) -> None:
         self.nodes: dict[str, GPUNode] = {}
         self._health_task: asyncio.Task | None = None
+        # Shared by all health probes so connections are kept alive between checks
+        self._probe = httpx.AsyncClient(timeout=5.0)
+        # Number of nodes currently healthy, kept in sync by _set_healthy()
+        self.healthy_count = 0
+        # Bumped whenever node state shown in status responses may have changed
+        self.version = 0
+        # Bumped only when the node set or a health flag changes; the filtered
+        # node lists below are cached against it: key -> (version, nodes)
+        self._membership_version = 0
+        self._query_cache: dict[tuple, tuple[int, list[GPUNode]]] = {}
+
+    def _set_healthy(self, node: GPUNode, healthy: bool) -> None:
+        """Update a node's health flag, keeping healthy_count in sync."""
+        if node.healthy != healthy:
+            node.healthy = healthy
+            self.healthy_count += 1 if healthy else -1
+            self._membership_version += 1
+
+    def _cached_query(self, key: tuple, predicate) -> list[GPUNode]:
+        """Nodes matching predicate, recomputed only after health/membership changes."""
+        cached = self._query_cache.get(key)
+        if cached is not None and cached[0] == self._membership_version:
+            return cached[1]
+        nodes = [n for n in self.nodes.values() if predicate(n)]
+        self._query_cache[key] = (self._membership_version, nodes)
+        return nodes
 
     def load_from_yaml(self, path: str | Path) -> None:
         """Parse gpus.yaml into GPUNode objects."""
@@ -96,46 +131,60 @@ class GPURegistry:
                 capabilities=set(entry.get("capabilities", [])),
                 max_resolution=entry.get("max_resolution", 1024),
                 max_batch=entry.get("max_batch", 1),
+                max_concurrency=entry.get("max_concurrency", 2),
             )
             self.nodes[node.id] = node
+            self.version += 1
+            self._membership_version += 1
             logger.info("Registered GPU node: %s (%s, %s tier)", node.id, node.name, node.tier.value)
 
     async def check_health(self, node: GPUNode) -> bool:
         """Check if a single ComfyUI instance is responsive."""
+        client = self._probe
+        start = time.monotonic()
+
+        async def get_system_stats() -> tuple[httpx.Response, float]:
+            resp = await client.get(f"{node.base_url}/system_stats")
+            return resp, (time.monotonic() - start) * 1000
+
         try:
-            start = time.monotonic()
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                resp = await client.get(f"{node.base_url}/system_stats")
-                elapsed_ms = (time.monotonic() - start) * 1000
-
-                if resp.status_code == 200:
-                    node.healthy = True
-                    node.last_response_ms = elapsed_ms
-                    node.last_health_check = time.time()
-
-                    # Also check queue depth
-                    try:
-                        queue_resp = await client.get(f"{node.base_url}/queue")
-                        if queue_resp.status_code == 200:
-                            queue_data = queue_resp.json()
-                            running = len(queue_data.get("queue_running", []))
-                            pending = len(queue_data.get("queue_pending", []))
-                            node.current_queue_length = running + pending
-                    except Exception:
-                        pass  # Queue check is best-effort
-
-                    logger.debug(
-                        "Health OK: %s (%s, %.0fms, queue=%d)",
-                        node.id, node.name, elapsed_ms, node.current_queue_length,
-                    )
-                    return True
-                else:
-                    node.healthy = False
-                    logger.warning("Health FAIL: %s returned status %d", node.id, resp.status_code)
-                    return False
+            # Liveness and queue depth are probed concurrently: one round trip
+            stats_result, queue_result = await asyncio.gather(
+                get_system_stats(),
+                client.get(f"{node.base_url}/queue"),
+                return_exceptions=True,
+            )
+            if isinstance(stats_result, BaseException):
+                raise stats_result
+            resp, elapsed_ms = stats_result
+
+            if resp.status_code == 200:
+                self._set_healthy(node, True)
+                node.last_response_ms = elapsed_ms
+                node.last_health_check = time.time()
+
+                # Queue depth is best-effort
+                try:
+                    if not isinstance(queue_result, BaseException) and queue_result.status_code == 200:
+                        queue_data = queue_result.json()
+                        running = len(queue_data.get("queue_running", []))
+                        pending = len(queue_data.get("queue_pending", []))
+                        node.current_queue_length = running + pending + node.dispatch_backlog
+                except Exception:
+                    pass
+
+                logger.debug(
+                    "Health OK: %s (%s, %.0fms, queue=%d)",
+                    node.id, node.name, elapsed_ms, node.current_queue_length,
+                )
+                return True
+            else:
+                self._set_healthy(node, False)
+                logger.warning("Health FAIL: %s returned status %d", node.id, resp.status_code)
+                return False
 
         except (httpx.ConnectError, httpx.TimeoutException, httpx.ConnectTimeout) as e:
-            node.healthy = False
+            self._set_healthy(node, False)
             node.last_health_check = time.time()
             logger.warning("Health FAIL: %s - %s", node.id, type(e).__name__)
             return False
@@ -146,6 +195,7 @@ class GPURegistry:
             *(self.check_health(node) for node in self.nodes.values()),
             return_exceptions=True,
         )
+        self.version += 1
         return {
             node_id: (result is True)
             for node_id, result in zip(self.nodes.keys(), results)
@@ -172,25 +222,37 @@ class GPURegistry:
             self._health_task.cancel()
             self._health_task = None
 
+    async def close(self) -> None:
+        """Close the health probe HTTP client. Called on shutdown."""
+        await self._probe.aclose()
+
     # --- Query methods ---
 
     def get_all_nodes(self) -> list[GPUNode]:
         return list(self.nodes.values())
 
+    # The filtered lists are cached and shared between callers; don't mutate them.
+
     def get_healthy_nodes(self) -> list[GPUNode]:
-        return [n for n in self.nodes.values() if n.healthy]
+        return self._cached_query(("healthy",), lambda n: n.healthy)
 
     def get_capable_nodes(self, capability: str) -> list[GPUNode]:
-        return [n for n in self.nodes.values() if n.healthy and capability in n.capabilities]
+        return self._cached_query(
+            ("capable", capability),
+            lambda n: n.healthy and capability in n.capabilities,
+        )
 
     def get_nodes_at_or_above_tier(self, min_tier: Tier) -> list[GPUNode]:
         min_rank = TIER_ORDER[min_tier]
-        return [n for n in self.nodes.values() if n.healthy and n.tier_rank >= min_rank]
+        return self._cached_query(
+            ("tier", min_tier),
+            lambda n: n.healthy and n.tier_rank >= min_rank,
+        )
 
     def get_least_loaded(self, candidates: list[GPUNode]) -> GPUNode | None:
         if not candidates:
             return None
-        return min(candidates, key=lambda n: n.current_queue_length)
+        return min(candidates, key=attrgetter("current_queue_length"))
 
     def get_node(self, gpu_id: str) -> GPUNode | None:
         return self.nodes.get(gpu_id)
@@ -198,7 +260,9 @@ class GPURegistry:
     def increment_load(self, gpu_id: str) -> None:
         if gpu_id in self.nodes:
             self.nodes[gpu_id].current_queue_length += 1
+            self.version += 1
 
     def decrement_load(self, gpu_id: str) -> None:
         if gpu_id in self.nodes:
             self.nodes[gpu_id].current_queue_length = max(0, self.nodes[gpu_id].current_queue_length - 1)
+            self.version += 1
@@ -9,11 +9,12 @@ Directory structure:
 
 from __future__ import annotations
 
-import io
+import asyncio
 import logging
+import os
 from pathlib import Path
 
-from PIL import Image
+from PIL import Image, features
 
 logger = logging.getLogger(__name__)
 
@@ -27,49 +28,71 @@ class ImageStore:
         self.uploads_dir = self.base_dir / "uploads"
         self.images_dir.mkdir(parents=True, exist_ok=True)
         self.uploads_dir.mkdir(parents=True, exist_ok=True)
+        # session_id -> stages whose directory is known to exist, so saves
+        # don't repeat the mkdir; forgotten when the session is deleted
+        self._stage_dirs: dict[str, set[int]] = {}
+        if not features.check_feature("libjpeg_turbo"):
+            logger.warning("Pillow is not built with libjpeg-turbo; thumbnail encoding will be slow")
+
+    async def _ensure_stage_dir(self, session_id: str, stage: int) -> Path:
+        """Return a session stage's image directory, creating it on first use."""
+        stage_dir = self.images_dir / session_id / f"stage_{stage}"
+        known = self._stage_dirs.setdefault(session_id, set())
+        if stage not in known:
+            await asyncio.to_thread(stage_dir.mkdir, parents=True, exist_ok=True)
+            known.add(stage)
+        return stage_dir
 
-    def _session_stage_dir(self, session_id: str, stage: int) -> Path:
-        d = self.images_dir / session_id / f"stage_{stage}"
-        d.mkdir(parents=True, exist_ok=True)
-        return d
+    async def prepare_image_path(self, session_id: str, stage: int, generation_id: str) -> Path:
+        """
+        Create the stage directory and return where a generation's full image
+        goes; the caller writes the file (e.g. streams a download into it),
+        then calls save_image_file().
+        """
+        stage_dir = await self._ensure_stage_dir(session_id, stage)
+        return stage_dir / f"{generation_id}.png"
 
-    async def save_image(
-        self,
-        session_id: str,
-        stage: int,
-        generation_id: str,
-        image_bytes: bytes,
-    ) -> tuple[str, str]:
+    async def save_image_file(self, image_path: Path) -> tuple[str, str]:
         """
-        Save full image and generate thumbnail.
+        Generate the thumbnail for a full image already written to the path
+        from prepare_image_path().
         Returns (image_path, thumbnail_path) relative to base_dir.
         """
-        stage_dir = self._session_stage_dir(session_id, stage)
-
-        # Save full image
-        image_path = stage_dir / f"{generation_id}.png"
-        image_path.write_bytes(image_bytes)
-
-        # Generate and save thumbnail
-        thumb_path = stage_dir / f"{generation_id}_thumb.jpg"
-        try:
-            img = Image.open(io.BytesIO(image_bytes))
-            img.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
-            img.save(str(thumb_path), "JPEG", quality=85)
-        except Exception:
-            logger.exception("Failed to create thumbnail for %s", generation_id)
+        thumb_path = image_path.with_name(f"{image_path.stem}_thumb.jpg")
+        if not await asyncio.to_thread(self._write_thumbnail, image_path, thumb_path):
             thumb_path = image_path  # fallback to full image
 
         rel_image = str(image_path.relative_to(self.base_dir))
         rel_thumb = str(thumb_path.relative_to(self.base_dir))
         return rel_image, rel_thumb
 
-    async def get_image(self, relative_path: str) -> bytes:
-        """Read image bytes from a path relative to base_dir."""
+    @staticmethod
+    def _write_thumbnail(source: Path, thumb_path: Path) -> bool:
+        """Write a JPEG thumbnail of an image file; False if it couldn't be made."""
+        try:
+            # thumbnail() first box-reduces by an integer factor to within 2x
+            # of the target, so a bilinear pass for the rest looks the same at
+            # thumbnail size as LANCZOS and costs less.
+            img = Image.open(source)
+            img.thumbnail(THUMBNAIL_SIZE, Image.Resampling.BILINEAR, reducing_gap=2.0)
+            if img.mode != "RGB":
+                img = img.convert("RGB")  # JPEG has no alpha/palette modes
+            # 4:2:0 chroma subsampling, baseline, no extra Huffman pass
+            img.save(
+                str(thumb_path), "JPEG",
+                quality=85, subsampling=2, optimize=False, progressive=False,
+            )
+        except Exception:
+            logger.exception("Failed to create thumbnail %s", thumb_path.name)
+            return False
+        return True
+
+    def resolve_path(self, relative_path: str) -> Path:
+        """Absolute path of a stored image, for serving it directly from disk."""
         full_path = self.base_dir / relative_path
-        if not full_path.exists():
+        if not full_path.is_file():
             raise FileNotFoundError(f"Image not found: {relative_path}")
-        return full_path.read_bytes()
+        return full_path
 
     async def save_upload(
         self,
@@ -95,48 +118,84 @@ class ImageStore:
         Keeps images whose generation_id is in keep_ids.
         """
         stage_dir = self.images_dir / session_id / f"stage_{stage}"
-        if not stage_dir.exists():
-            return 0
+        return await asyncio.to_thread(self._delete_unselected, str(stage_dir), keep_ids)
 
+    @staticmethod
+    def _delete_unselected(stage_dir: str, keep_ids: set[str]) -> int:
         deleted = 0
-        for f in stage_dir.iterdir():
-            # Extract generation_id from filename (e.g., "abc123.png" or "abc123_thumb.jpg")
-            gen_id = f.stem.replace("_thumb", "")
-            if gen_id not in keep_ids:
-                f.unlink()
-                deleted += 1
-
+        try:
+            entries = os.scandir(stage_dir)
+        except FileNotFoundError:
+            return 0
+        with entries:
+            for entry in entries:
+                # Extract generation_id from filename (e.g., "abc123.png" or "abc123_thumb.jpg")
+                gen_id = entry.name.rsplit(".", 1)[0].removesuffix("_thumb")
+                if gen_id not in keep_ids:
+                    os.unlink(entry.path)
+                    deleted += 1
         return deleted
 
     async def delete_session(self, session_id: str) -> int:
         """Delete all images for a session. Returns count of deleted files."""
-        deleted = 0
-        for d in [self.images_dir / session_id, self.uploads_dir / session_id]:
-            if d.exists():
-                for f in d.rglob("*"):
-                    if f.is_file():
-                        f.unlink()
-                        deleted += 1
-                # Remove empty directories
-                for sub in sorted(d.rglob("*"), reverse=True):
-                    if sub.is_dir():
-                        try:
-                            sub.rmdir()
-                        except OSError:
-                            pass
-                try:
-                    d.rmdir()
-                except OSError:
-                    pass
+        self._stage_dirs.pop(session_id, None)
+        # Pure filesystem work; run it off the event loop
+        return await asyncio.to_thread(self._delete_session_files, session_id)
 
-        return deleted
+    def _delete_session_files(self, session_id: str) -> int:
+        return sum(
+            self._remove_tree(str(d))
+            for d in (self.images_dir / session_id, self.uploads_dir / session_id)
+        )
 
     async def get_session_disk_usage(self, session_id: str) -> int:
         """Return total bytes used by a session's images."""
+        return await asyncio.to_thread(
+            lambda: sum(
+                self._tree_size(str(d))
+                for d in (self.images_dir / session_id, self.uploads_dir / session_id)
+            )
+        )
+
+    # scandir() reports each entry's type from the directory listing itself,
+    # so these walks need no extra stat() per entry to tell files from
+    # directories (and build no Path objects).
+
+    @staticmethod
+    def _remove_tree(path: str) -> int:
+        """Delete a directory tree. Returns count of deleted files; 0 if missing."""
+        deleted = 0
+        try:
+            entries = os.scandir(path)
+        except FileNotFoundError:
+            return 0
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    deleted += ImageStore._remove_tree(entry.path)
+                else:
+                    os.unlink(entry.path)
+                    deleted += 1
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+        return deleted
+
+    @staticmethod
+    def _tree_size(path: str) -> int:
+        """Total size in bytes of the files under a directory; 0 if missing."""
         total = 0
-        for d in [self.images_dir / session_id, self.uploads_dir / session_id]:
-            if d.exists():
-                for f in d.rglob("*"):
-                    if f.is_file():
-                        total += f.stat().st_size
+        pending = [path]
+        while pending:
+            try:
+                entries = os.scandir(pending.pop())
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
         return total
@@ -3,12 +3,45 @@
 from __future__ import annotations
 
 import asyncio
+import functools
+import heapq
 import logging
 import re
-from typing import List, Dict, Set, Optional
+import time
+from collections import defaultdict
+from typing import List, Dict, FrozenSet, Set, Optional
 
 logger = logging.getLogger(__name__)
 
+# SD prompt syntax that carries no keywords: (weighted:1.2) groups and <embeddings>
+_SD_SYNTAX = re.compile(r'\([^)]*\)|<[^>]*>')
+
+# Common words that say nothing about which LoRA fits a prompt
+STOP_WORDS = frozenset({
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'of', 'in', 'on', 'at',
+    'to', 'for', 'with', 'by', 'from', 'as', 'and', 'or', 'but',
+    'very', 'highly', 'extremely', 'detailed', 'quality', 'best'
+})
+
+# Keywords are matched as substrings of LoRA names, so the name index is
+# keyed on character trigrams: every name containing a keyword contains all
+# of the keyword's trigrams.
+_NGRAM = 3
+
+
+def _ngrams(text: str) -> Set[str]:
+    return {text[i:i + _NGRAM] for i in range(len(text) - _NGRAM + 1)}
+
+
+@functools.lru_cache(maxsize=1024)
+def _extract_keywords(prompt: str) -> FrozenSet[str]:
+    # Remove common SD syntax (every match opens with '(' or '<', so plain
+    # prompts skip the regex), then split and lowercase, keeping significant terms
+    if '(' in prompt or '<' in prompt:
+        prompt = _SD_SYNTAX.sub('', prompt)
+    words = prompt.lower().split()
+    return frozenset(w.strip('.,!?;:') for w in words if len(w) > 3 and w not in STOP_WORDS)
+
 
 class LoRADiscovery:
     """Discover and recommend LoRAs based on prompt keywords."""
@@ -17,6 +50,9 @@ class LoRADiscovery:
         self.lora_cache: Dict[str, List[str]] = {}  # gpu_id -> list of lora names
         self.keyword_cache: Dict[str, Set[str]] = {}  # lora_name -> set of keywords
         self.last_update: Dict[str, float] = {}  # gpu_id -> timestamp
+        self._all_loras: Optional[List[str]] = None  # memoized union, reset on fetch
+        # lowercased names + trigram -> name positions, built for _all_loras
+        self._name_index: Optional[tuple[List[str], Dict[str, Set[int]]]] = None
         self.polling_task: Optional[asyncio.Task] = None
         self.client_pool = None  # Will be set during initialization
 
@@ -55,22 +91,26 @@ class LoRADiscovery:
         if not self.client_pool:
             return
 
-        import time
         tasks = []
         for gpu_id, client in self.client_pool.clients.items():
             tasks.append(self._fetch_and_cache(client, gpu_id))
 
         await asyncio.gather(*tasks, return_exceptions=True)
 
+        # Lowercase and index the names here rather than on the first
+        # prompt after the poll
+        self._get_name_index()
+
     async def _fetch_and_cache(self, client, gpu_id: str):
         """Fetch LoRAs from a single GPU and cache them."""
-        import time
         try:
             info = await client.get_object_info()
             lora_loader_info = info.get("LoraLoader", {})
             loras = lora_loader_info.get("input", {}).get("required", {}).get("lora_name", [[]])[0]
 
             self.lora_cache[gpu_id] = loras
+            self._all_loras = None
+            self._name_index = None
             self.last_update[gpu_id] = time.time()
             logger.info("Cached %d LoRAs from %s", len(loras), gpu_id)
         except Exception as e:
@@ -80,35 +120,23 @@ class LoRADiscovery:
         """
         Get cached LoRAs for a GPU (or union of all GPUs if gpu_id=None).
 
-        Returns empty list if cache is not yet populated.
+        Returns empty list if cache is not yet populated. The union is
+        computed once per poll and shared between callers, so treat the
+        returned list as read-only.
         """
         if gpu_id:
             return self.lora_cache.get(gpu_id, [])
-        else:
-            # Return union of all LoRAs across all GPUs
+        if self._all_loras is None:
+            # Union of all LoRAs across all GPUs
             all_loras = set()
             for loras in self.lora_cache.values():
                 all_loras.update(loras)
-            return sorted(all_loras)
+            self._all_loras = sorted(all_loras)
+        return self._all_loras
 
-    def extract_keywords(self, prompt: str) -> Set[str]:
+    def extract_keywords(self, prompt: str) -> FrozenSet[str]:
         """Extract meaningful keywords from prompt."""
-        # Remove common SD syntax
-        cleaned = re.sub(r'\([^)]*\)', '', prompt)  # Remove weight syntax
-        cleaned = re.sub(r'<[^>]*>', '', cleaned)   # Remove embeddings
-
-        # Split and lowercase
-        words = cleaned.lower().split()
-
-        # Filter out common words and keep significant terms
-        stop_words = {
-            'a', 'an', 'the', 'is', 'are', 'was', 'were', 'of', 'in', 'on', 'at',
-            'to', 'for', 'with', 'by', 'from', 'as', 'and', 'or', 'but',
-            'very', 'highly', 'extremely', 'detailed', 'quality', 'best'
-        }
-
-        keywords = {w.strip('.,!?;:') for w in words if len(w) > 3 and w not in stop_words}
-        return keywords
+        return _extract_keywords(prompt)
 
     def match_loras_to_prompt(
         self,
@@ -121,35 +149,52 @@ class LoRADiscovery:
 
         Returns list of {"name": str, "relevance": float, "matched_keywords": List[str]}
         """
+        if not available_loras:
+            return []
         keywords = self.extract_keywords(prompt)
         if not keywords:
             return []
 
-        matches = []
-        for lora_name in available_loras:
-            lora_lower = lora_name.lower()
-            matched = []
-
-            for keyword in keywords:
-                # Check if keyword appears in LoRA name
-                if keyword in lora_lower:
-                    matched.append(keyword)
-                # Check partial matches (e.g., "anime" matches "anime_style")
-                elif any(keyword in part for part in lora_lower.split('_')):
-                    matched.append(keyword)
-
-            if matched:
-                # Calculate relevance score
-                relevance = len(matched) / len(keywords)
-                matches.append({
-                    "name": lora_name,
-                    "relevance": relevance,
-                    "matched_keywords": matched
-                })
-
-        # Sort by relevance and return top matches
-        matches.sort(key=lambda x: x["relevance"], reverse=True)
-        return matches[:max_results]
+        if available_loras is self._all_loras:
+            lowered, index = self._get_name_index()
+        else:
+            lowered, index = [name.lower() for name in available_loras], None
+
+        # position in available_loras -> matched keywords
+        matched: Dict[int, List[str]] = defaultdict(list)
+        for keyword in keywords:
+            if index is None or len(keyword) < _NGRAM:
+                candidates = range(len(lowered))
+            else:
+                postings = sorted((index.get(g, ()) for g in _ngrams(keyword)), key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+            # Substring check also covers partial matches (e.g., "anime" in "anime_style")
+            for i in candidates:
+                if keyword in lowered[i]:
+                    matched[i].append(keyword)
+
+        # Top matches by relevance (proportional to matched keyword count),
+        # ties in available_loras order; result dicts only for those
+        top = heapq.nlargest(max_results, sorted(matched), key=lambda i: len(matched[i]))
+        return [
+            {
+                "name": available_loras[i],
+                "relevance": len(matched[i]) / len(keywords),
+                "matched_keywords": matched[i],
+            }
+            for i in top
+        ]
+
+    def _get_name_index(self) -> tuple[List[str], Dict[str, Set[int]]]:
+        """Trigram index over the cached LoRA union, rebuilt once per poll."""
+        if self._name_index is None:
+            lowered = [name.lower() for name in self.get_cached_loras(None)]
+            index: Dict[str, Set[int]] = defaultdict(set)
+            for i, name in enumerate(lowered):
+                for gram in _ngrams(name):
+                    index[gram].add(i)
+            self._name_index = (lowered, dict(index))
+        return self._name_index
 
     def suggest_lora_specs(
         self,
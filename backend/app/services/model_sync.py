@@ -8,15 +8,28 @@ Implements smart caching based on usage patterns.
 from __future__ import annotations
 
 import logging
+import re
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Dict, Set, List, Optional
-from collections import defaultdict
+from itertools import islice
+from typing import Callable, Deque, Dict, Set, List, Optional, Tuple
+from collections import defaultdict, deque
 
 logger = logging.getLogger(__name__)
 
+# Model-name markers used by _classify_model_family ("xl" also covers "sdxl").
+# Matched case-insensitively so names needn't be lowercased first.
+_SDXL_MARKERS = re.compile(r'xl|pony|juggernaut', re.IGNORECASE)
+_SD15_MARKERS = re.compile(r'v1-5|sd15|1\.5|dreamshaper', re.IGNORECASE)
 
-@dataclass
+# Most recent uses remembered per model; also the largest usable min_uses
+USAGE_HISTORY_SIZE = 256
+
+# Families a node may use when its constraints don't say otherwise
+ALL_FAMILIES = frozenset({"sd15", "sdxl"})
+
+
+@dataclass(slots=True)
 class ModelInfo:
     """Information about a model file."""
     name: str
@@ -28,7 +41,7 @@ class ModelInfo:
     use_count: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class NodeModelCache:
     """Track what's cached on a specific GPU node."""
     node_id: str
@@ -62,29 +75,35 @@ class ModelSyncManager:
         self.nas_upscalers: Dict[str, ModelInfo] = {}
         self.nas_vae: Dict[str, ModelInfo] = {}
 
+        # Checkpoint/LoRA name tuples served by /nas-models, rebuilt after discovery
+        self._nas_model_names: Optional[Dict[str, Tuple[str, ...]]] = None
+
         # Per-node caches
         self.node_caches: Dict[str, NodeModelCache] = {}
 
-        # Usage tracking for smart caching
-        self.model_usage: Dict[str, List[datetime]] = defaultdict(list)
+        # Usage tracking for smart caching: most recent use timestamps per
+        # model, oldest first
+        self.model_usage: Dict[str, Deque[datetime]] = defaultdict(
+            lambda: deque(maxlen=USAGE_HISTORY_SIZE)
+        )
 
         # Node capabilities (from config)
         self.node_constraints = {
             "gpu-draft": {
                 "max_cache_mb": 10000,  # 10GB cache
-                "allowed_families": ["sd15"],  # 3050Ti: SD1.5 only
+                "allowed_families": frozenset({"sd15"}),  # 3050Ti: SD1.5 only
             },
             "gpu-standard": {
                 "max_cache_mb": 30000,  # 30GB cache
-                "allowed_families": ["sd15", "sdxl"],
+                "allowed_families": ALL_FAMILIES,
             },
             "gpu-quality": {
                 "max_cache_mb": 30000,
-                "allowed_families": ["sd15", "sdxl"],
+                "allowed_families": ALL_FAMILIES,
             },
             "gpu-premium": {
                 "max_cache_mb": 50000,  # 50GB cache
-                "allowed_families": ["sd15", "sdxl"],
+                "allowed_families": ALL_FAMILIES,
             },
         }
 
@@ -150,74 +169,18 @@ class ModelSyncManager:
             clip_vision_list = clip_vision_node.get("input", {}).get("clip_name", [[]])[0] if clip_vision_node else []
 
             # Classify by family (SD1.5 vs SDXL)
-            for ckpt_name in ckpt_list:
-                family = self._classify_model_family(ckpt_name)
-                self.nas_checkpoints[ckpt_name] = ModelInfo(
-                    name=ckpt_name,
-                    path=f"checkpoints/{ckpt_name}",
-                    size_mb=0,  # TODO: Query actual size
-                    model_type="checkpoint",
-                    family=family,
-                )
-
-            for lora_name in lora_list:
-                family = self._classify_model_family(lora_name)
-                self.nas_loras[lora_name] = ModelInfo(
-                    name=lora_name,
-                    path=f"loras/{lora_name}",
-                    size_mb=0,
-                    model_type="lora",
-                    family=family,
-                )
-
-            for cn_name in controlnet_list:
-                family = self._classify_model_family(cn_name)
-                self.nas_controlnets[cn_name] = ModelInfo(
-                    name=cn_name,
-                    path=f"controlnet/{cn_name}",
-                    size_mb=0,
-                    model_type="controlnet",
-                    family=family,
-                )
-
-            for ipa_name in ipadapter_list:
-                family = self._classify_model_family(ipa_name)
-                self.nas_ipadapters[ipa_name] = ModelInfo(
-                    name=ipa_name,
-                    path=f"ipadapter/{ipa_name}",
-                    size_mb=0,
-                    model_type="ipadapter",
-                    family=family,
-                )
-
-            for up_name in upscale_list:
-                self.nas_upscalers[up_name] = ModelInfo(
-                    name=up_name,
-                    path=f"upscale_models/{up_name}",
-                    size_mb=0,
-                    model_type="upscaler",
-                    family="universal",  # Most upscalers work with any model
-                )
-
-            for vae_name in vae_list:
-                family = self._classify_model_family(vae_name)
-                self.nas_vae[vae_name] = ModelInfo(
-                    name=vae_name,
-                    path=f"vae/{vae_name}",
-                    size_mb=0,
-                    model_type="vae",
-                    family=family,
-                )
-
-            for clip_vision_name in clip_vision_list:
-                # CLIP vision models are universal (work with both SD1.5 and SDXL)
-                self.nas_clip_vision[clip_vision_name] = ModelInfo(
-                    name=clip_vision_name,
-                    path=f"clip_vision/{clip_vision_name}",
-                    size_mb=0,
-                    model_type="clip_vision",
-                    family="universal",  # Works with all IP-Adapters
-                )
+            classify = self._classify_model_family
+            self._ingest(ckpt_list, self.nas_checkpoints, "checkpoint", "checkpoints", classify)
+            self._ingest(lora_list, self.nas_loras, "lora", "loras", classify)
+            self._ingest(controlnet_list, self.nas_controlnets, "controlnet", "controlnet", classify)
+            self._ingest(ipadapter_list, self.nas_ipadapters, "ipadapter", "ipadapter", classify)
+            # Most upscalers work with any model
+            self._ingest(upscale_list, self.nas_upscalers, "upscaler", "upscale_models")
+            self._ingest(vae_list, self.nas_vae, "vae", "vae", classify)
+            # CLIP vision models are universal (work with both SD1.5 and SDXL)
+            self._ingest(clip_vision_list, self.nas_clip_vision, "clip_vision", "clip_vision")
+
+            self._nas_model_names = None
 
             logger.info(
                 "Discovered models on NAS: %d checkpoints, %d LoRAs, %d ControlNets, "
@@ -245,16 +208,41 @@ class ModelSyncManager:
             logger.error("Failed to discover NAS models: %s", e)
             return {}
 
+    @staticmethod
+    def _ingest(
+        names: List[str],
+        target: Dict[str, ModelInfo],
+        model_type: str,
+        folder: str,
+        family_fn: Optional[Callable[[str], str]] = None,
+    ) -> None:
+        """Record discovered models of one type; family is "universal" without family_fn."""
+        for name in names:
+            target[name] = ModelInfo(
+                name=name,
+                path=f"{folder}/{name}",
+                size_mb=0,  # TODO: Query actual size
+                model_type=model_type,
+                family=family_fn(name) if family_fn else "universal",
+            )
+
+    def nas_model_names(self) -> Dict[str, Tuple[str, ...]]:
+        """Checkpoint and LoRA names on the NAS, snapshotted once per discovery."""
+        if self._nas_model_names is None:
+            self._nas_model_names = {
+                "checkpoints": tuple(self.nas_checkpoints),
+                "loras": tuple(self.nas_loras),
+            }
+        return self._nas_model_names
+
     def _classify_model_family(self, model_name: str) -> str:
         """Classify model as SD1.5 or SDXL based on naming conventions."""
-        name_lower = model_name.lower()
-
         # SDXL indicators
-        if any(x in name_lower for x in ["xl", "sdxl", "pony", "juggernaut"]):
+        if _SDXL_MARKERS.search(model_name):
             return "sdxl"
 
         # SD1.5 indicators
-        if any(x in name_lower for x in ["v1-5", "sd15", "1.5", "dreamshaper"]):
+        if _SD15_MARKERS.search(model_name):
             return "sd15"
 
         # Default: assume SDXL if it's large
@@ -263,7 +251,7 @@ class ModelSyncManager:
     def can_node_use_model(self, node_id: str, model_name: str, model_type: str = "checkpoint") -> bool:
         """Check if a node can use this model based on constraints."""
         constraints = self.node_constraints.get(node_id, {})
-        allowed_families = constraints.get("allowed_families", ["sd15", "sdxl"])
+        allowed_families = constraints.get("allowed_families", ALL_FAMILIES)
 
         # Get model info
         if model_type == "checkpoint":
@@ -306,8 +294,11 @@ class ModelSyncManager:
         hot_loras = []
 
         for name, timestamps in self.model_usage.items():
-            recent_uses = [t for t in timestamps if t > cutoff]
-            if len(recent_uses) >= min_uses:
+            # Timestamps are in use order, so there are at least min_uses
+            # recent uses exactly when the min_uses-th newest is recent
+            if min_uses <= 0 or (
+                len(timestamps) >= min_uses and timestamps[-min_uses] > cutoff
+            ):
                 if name in self.nas_checkpoints:
                     hot_checkpoints.append(name)
                 elif name in self.nas_loras:
@@ -328,21 +319,24 @@ class ModelSyncManager:
         - Cache capacity
         """
         constraints = self.node_constraints.get(node_id, {})
-        allowed_families = constraints.get("allowed_families", ["sd15", "sdxl"])
+        allowed_families = constraints.get("allowed_families", ALL_FAMILIES)
 
         # Get hot models
         hot = self.get_hot_models()
 
-        # Filter by what this node can use
-        recommended_checkpoints = [
-            name for name in hot["checkpoints"]
-            if self.nas_checkpoints[name].family in allowed_families
-        ][:max_items]
+        # Filter by what this node can use, stopping at max_items
+        max_items = max(0, max_items)
+        checkpoints = self.nas_checkpoints
+        recommended_checkpoints = list(islice(
+            (name for name in hot["checkpoints"] if checkpoints[name].family in allowed_families),
+            max_items,
+        ))
 
-        recommended_loras = [
-            name for name in hot["loras"]
-            if self.nas_loras[name].family in allowed_families
-        ][:max_items]
+        loras = self.nas_loras
+        recommended_loras = list(islice(
+            (name for name in hot["loras"] if loras[name].family in allowed_families),
+            max_items,
+        ))
 
         return {
             "checkpoints": recommended_checkpoints,
@@ -362,7 +356,7 @@ class ModelSyncManager:
                     "cached_loras": len(cache.cached_loras),
                     "cache_used_mb": cache.cache_used_mb,
                     "cache_capacity_mb": cache.cache_capacity_mb,
-                    "last_sync": cache.last_sync.isoformat() if cache.last_sync else None,
+                    "last_sync": cache.last_sync,
                 }
                 for node_id, cache in self.node_caches.items()
             },
@@ -6,19 +6,32 @@ Tracks selections/rejections with context and provides personalized recommendati
 
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
 import math
+import time
 from collections import defaultdict
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Tuple, Optional
 
-from sqlalchemy import select, func
+from sqlalchemy import func, insert, select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..models.database import utcnow
 from ..models.preference_orm import UserPreferenceORM, PreferenceStatsORM
 
 logger = logging.getLogger(__name__)
 
+# Background writer: queued (user_id, record) pairs, and how long the writer
+# keeps collecting after the first one before writing the batch
+WRITE_QUEUE_SIZE = 1024
+WRITE_BATCH_WINDOW = 0.05
+# A batch whose write fails is retried once after this delay, then dropped
+WRITE_RETRY_DELAY = 1.0
+
+# LoRA recommendations are read-mostly; recording preferences clears the cache
+RECOMMENDATION_TTL = 60.0
+RECOMMENDATION_CACHE_SIZE = 1024
+
 
 class PreferenceLearning:
     """
@@ -35,6 +48,14 @@ class PreferenceLearning:
         # In-memory cache for fast lookups (synced from DB)
         self.stats_cache: Dict[Tuple[str, str], Dict] = {}
         self.last_cache_update: float = 0
+        self._recommendations: Dict[tuple, Tuple[float, List[Tuple[str, float]]]] = {}
+        # Bumped on every invalidation so a lookup that read the DB before
+        # a commit doesn't cache its result after it
+        self._recommendations_epoch: int = 0
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        # Queued preferences lost because their batch could not be written
+        self.dropped_preferences: int = 0
 
     def extract_keywords(self, prompt: str) -> List[str]:
         """
@@ -86,115 +107,230 @@ class PreferenceLearning:
             rejected: User rejected this image
             Other args: Context for learning
         """
-        keywords = self.extract_keywords(prompt)
-        action = "selected" if selected else ("rejected" if rejected else "neutral")
-
-        # Store preference record
-        pref = UserPreferenceORM(
+        await self.record_preferences(
+            db,
+            [{
+                "prompt": prompt,
+                "checkpoint": checkpoint,
+                "loras": loras,
+                "selected": selected,
+                "rejected": rejected,
+                "model_family": model_family,
+                "task_type": task_type,
+                "stage": stage,
+                "session_id": session_id,
+                "generation_id": generation_id,
+                "feedback_text": feedback_text,
+                "negative_prompt": negative_prompt,
+                "vision_description": vision_description,
+            }],
             user_id=user_id,
-            prompt=prompt,
-            keywords=json.dumps(keywords),
-            negative_prompt=negative_prompt,
-            checkpoint=checkpoint,
-            loras=json.dumps(loras),
-            model_family=model_family,
-            task_type=task_type,
-            action=action,
-            feedback_text=feedback_text,
-            stage=stage,
-            session_id=session_id,
-            generation_id=generation_id,
-            vision_description=vision_description,
         )
-        db.add(pref)
 
-        # Update aggregated stats
-        await self._update_stats(
-            db, user_id, keywords, checkpoint, loras, selected
-        )
+    async def record_preferences(
+        self,
+        db: AsyncSession,
+        records: List[Dict],
+        user_id: str = "default",
+        commit: bool = True,
+    ):
+        """
+        Record many preferences in a single transaction.
 
-        await db.commit()
+        Each record takes the same keys as record_preference's arguments.
+        All preference rows go out as one multi-row INSERT and everything
+        (rows + aggregated stats) is committed once. Pass commit=False to
+        leave the commit to a caller that has other pending changes; that
+        caller must call _invalidate_recommendations() once it commits.
+        """
+        if not records:
+            return
+
+        # One timestamp for the whole batch; they're recorded in the same instant
+        now = utcnow()
+        rows = [self.build_preference_row(record, user_id, now) for record in records]
+
+        # Aggregate stat increments across the batch: (stat_type, key) -> [total, selected]
+        increments: Dict[Tuple[str, str], List[int]] = defaultdict(lambda: [0, 0])
+        for row in rows:
+            selected = row["action"] == "selected"
+            for stat_key in self._stat_keys(row["keywords"], row["checkpoint"], row["loras"]):
+                counts = increments[stat_key]
+                counts[0] += 1
+                if selected:
+                    counts[1] += 1
+        await self._apply_stat_increments(db, user_id, increments)
+
+        # Store preference records
+        await db.execute(insert(UserPreferenceORM), rows)
+        if commit:
+            await db.commit()
+            self._invalidate_recommendations()
 
         logger.info(
-            "Recorded preference: %s, checkpoint=%s, keywords=%s",
-            action, checkpoint, keywords[:3]
+            "Recorded %d preference(s): %s",
+            len(rows),
+            {row["action"] for row in rows},
         )
 
-    async def _update_stats(
+    def start_writer(self, session_factory: Callable[[], AsyncSession]):
+        """Start the background task that writes queued preferences."""
+        self._write_queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._writer_task = asyncio.create_task(self._writer_loop(session_factory))
+        logger.info("Started preference writer")
+
+    async def stop_writer(self):
+        """Write whatever is still queued, then stop the writer."""
+        if self._writer_task is None:
+            return
+        await self._write_queue.put(None)
+        await self._writer_task
+        self._writer_task = None
+        logger.info("Stopped preference writer")
+
+    async def queue_preferences(self, records: List[Dict], user_id: str = "default"):
+        """
+        Hand preferences to the background writer instead of writing them
+        on the caller's request path.
+
+        Takes the same records as record_preferences(). Only waits if the
+        queue is full.
+        """
+        for record in records:
+            await self._write_queue.put((user_id, record))
+
+    async def _writer_loop(self, session_factory: Callable[[], AsyncSession]):
+        """Drain the queue in batches, one transaction per batch."""
+        stopping = False
+        while not stopping:
+            item = await self._write_queue.get()
+            batch = []
+            if item is not None:
+                batch.append(item)
+                # Let the rest of a burst arrive, then take everything queued
+                # without awaiting, so no dequeued item can be lost to a timeout
+                await asyncio.sleep(WRITE_BATCH_WINDOW)
+                while not self._write_queue.empty():
+                    item = self._write_queue.get_nowait()
+                    if item is None:
+                        break
+                    batch.append(item)
+            stopping = item is None
+
+            if not batch:
+                continue
+            by_user: Dict[str, List[Dict]] = defaultdict(list)
+            for user_id, record in batch:
+                by_user[user_id].append(record)
+            for attempt in (1, 2):
+                try:
+                    async with session_factory() as db:
+                        for user_id, records in by_user.items():
+                            await self.record_preferences(db, records, user_id=user_id, commit=False)
+                        await db.commit()
+                    self._invalidate_recommendations()
+                    break
+                except Exception:
+                    if attempt == 1:
+                        logger.warning(
+                            "Failed to write %d queued preference(s), retrying",
+                            len(batch), exc_info=True,
+                        )
+                        await asyncio.sleep(WRITE_RETRY_DELAY)
+                    else:
+                        self.dropped_preferences += len(batch)
+                        logger.exception(
+                            "Dropped %d queued preference(s) after retry (%d dropped so far)",
+                            len(batch), self.dropped_preferences,
+                        )
+
+    def _invalidate_recommendations(self):
+        """Drop cached recommendations; call only after new stats are committed."""
+        self._recommendations.clear()
+        self._recommendations_epoch += 1
+
+    def build_preference_row(self, record: Dict, user_id: str, timestamp) -> Dict:
+        """Turn a record_preferences() record into a UserPreferenceORM row dict."""
+        selected = record.get("selected", False)
+        rejected = record.get("rejected", False)
+        return {
+            "timestamp": timestamp,
+            "user_id": user_id,
+            "prompt": record["prompt"],
+            "keywords": self.extract_keywords(record["prompt"]),
+            "negative_prompt": record.get("negative_prompt"),
+            "checkpoint": record["checkpoint"],
+            "loras": record.get("loras", []),
+            "model_family": record["model_family"],
+            "task_type": record["task_type"],
+            "action": "selected" if selected else ("rejected" if rejected else "neutral"),
+            "feedback_text": record.get("feedback_text"),
+            "stage": record["stage"],
+            "session_id": record["session_id"],
+            "generation_id": record["generation_id"],
+            "vision_description": record.get("vision_description"),
+        }
+
+    def _stat_keys(
         self,
-        db: AsyncSession,
-        user_id: str,
         keywords: List[str],
         checkpoint: str,
         loras: List[Dict[str, float]],
-        selected: bool,
-    ):
-        """Update aggregated statistics for fast lookups."""
-
-        # Update keyword + checkpoint stats
-        for keyword in keywords:
-            await self._increment_stat(
-                db, user_id, "keyword_checkpoint", f"{keyword}:{checkpoint}", selected
-            )
-
-        # Update keyword + LoRA stats
-        for lora in loras:
-            lora_name = lora.get("name", "")
-            for keyword in keywords:
-                await self._increment_stat(
-                    db, user_id, "keyword_lora", f"{keyword}:{lora_name}", selected
-                )
-
-        # Update checkpoint + LoRA stats
-        for lora in loras:
-            lora_name = lora.get("name", "")
-            await self._increment_stat(
-                db, user_id, "checkpoint_lora", f"{checkpoint}:{lora_name}", selected
-            )
-
-        # Update overall checkpoint stats
-        await self._increment_stat(
-            db, user_id, "checkpoint_overall", checkpoint, selected
-        )
+    ) -> List[Tuple[str, str]]:
+        """(stat_type, key) pairs a single preference counts towards."""
+        lora_names = [lora.get("name", "") for lora in loras]
+        # keyword + checkpoint
+        stat_keys = [("keyword_checkpoint", f"{keyword}:{checkpoint}") for keyword in keywords]
+        # keyword + LoRA
+        stat_keys += [
+            ("keyword_lora", f"{keyword}:{lora_name}")
+            for lora_name in lora_names
+            for keyword in keywords
+        ]
+        # checkpoint + LoRA
+        stat_keys += [("checkpoint_lora", f"{checkpoint}:{lora_name}") for lora_name in lora_names]
+        # overall checkpoint
+        stat_keys.append(("checkpoint_overall", checkpoint))
+        return stat_keys
 
-    async def _increment_stat(
+    async def _apply_stat_increments(
         self,
         db: AsyncSession,
         user_id: str,
-        stat_type: str,
-        key: str,
-        selected: bool,
+        increments: Dict[Tuple[str, str], List[int]],
     ):
-        """Increment or create a stat entry."""
-        # Try to find existing stat
+        """
+        Update aggregated statistics for fast lookups.
+
+        Existing stat rows for every touched key are fetched in one SELECT;
+        missing ones are created.
+        """
+        if not increments:
+            return
+
         result = await db.execute(
             select(PreferenceStatsORM).where(
                 PreferenceStatsORM.user_id == user_id,
-                PreferenceStatsORM.stat_type == stat_type,
-                PreferenceStatsORM.key == key,
+                tuple_(PreferenceStatsORM.stat_type, PreferenceStatsORM.key).in_(list(increments)),
             )
         )
-        stat = result.scalar_one_or_none()
-
-        if stat:
-            # Update existing
-            stat.total_count += 1
-            if selected:
-                stat.selected_count += 1
+        existing = {(stat.stat_type, stat.key): stat for stat in result.scalars()}
+
+        for (stat_type, key), (total, selected) in increments.items():
+            stat = existing.get((stat_type, key))
+            if stat is None:
+                stat = PreferenceStatsORM(
+                    user_id=user_id,
+                    stat_type=stat_type,
+                    key=key,
+                    selected_count=0,
+                    total_count=0,
+                )
+                db.add(stat)
+            stat.total_count += total
+            stat.selected_count += selected
             stat.selection_rate = stat.selected_count / stat.total_count
             stat.confidence_score = self._calculate_confidence(stat.total_count)
-        else:
-            # Create new
-            stat = PreferenceStatsORM(
-                user_id=user_id,
-                stat_type=stat_type,
-                key=key,
-                selected_count=1 if selected else 0,
-                total_count=1,
-                selection_rate=1.0 if selected else 0.0,
-                confidence_score=self._calculate_confidence(1),
-            )
-            db.add(stat)
 
     def _calculate_confidence(self, sample_size: int) -> float:
         """
@@ -281,6 +417,9 @@ class PreferenceLearning:
         """
         Recommend LoRAs for prompt + checkpoint based on user history.
 
+        Results are cached per (keywords, checkpoint, count, user, LoRAs) for
+        RECOMMENDATION_TTL seconds.
+
         Returns: [(lora_name, score), ...]
         """
         keywords = self.extract_keywords(prompt)
@@ -288,6 +427,13 @@ class PreferenceLearning:
         if not keywords:
             return []
 
+        now = time.monotonic()
+        epoch = self._recommendations_epoch
+        cache_key = (tuple(keywords), checkpoint, count, user_id, tuple(available_loras))
+        cached = self._recommendations.get(cache_key)
+        if cached is not None and now - cached[0] < RECOMMENDATION_TTL:
+            return cached[1]
+
         lora_scores = {}
         for lora in available_loras:
             scores = []
@@ -330,7 +476,16 @@ class PreferenceLearning:
 
         # Return top N LoRAs
         sorted_loras = sorted(lora_scores.items(), key=lambda x: x[1], reverse=True)
-        return sorted_loras[:count]
+        recommendations = sorted_loras[:count]
+
+        if epoch != self._recommendations_epoch:
+            # Preferences were committed while this ran; don't cache old data
+            return recommendations
+        if len(self._recommendations) >= RECOMMENDATION_CACHE_SIZE:
+            # Evict the oldest entry (dicts keep insertion order)
+            del self._recommendations[next(iter(self._recommendations))]
+        self._recommendations[cache_key] = (now, recommendations)
+        return recommendations
 
     async def get_stats_summary(
         self,
@@ -420,9 +575,9 @@ class PreferenceLearning:
             "preferences": [
                 {
                     "prompt": p.prompt,
-                    "keywords": json.loads(p.keywords),
+                    "keywords": p.keywords,
                     "checkpoint": p.checkpoint,
-                    "loras": json.loads(p.loras),
+                    "loras": p.loras,
                     "action": p.action,
                     "timestamp": p.timestamp.isoformat(),
                 }
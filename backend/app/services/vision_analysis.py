@@ -2,14 +2,18 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
 import base64
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Coroutine, Optional, Dict, List
 import httpx
 
 logger = logging.getLogger(__name__)
 
+# Background analyses allowed to run against Ollama at the same time
+MAX_CONCURRENT_ANALYSES = 4
+
 
 class VisionAnalysis:
     """Analyze images using Ollama vision models (read-only, logging only)."""
@@ -18,6 +22,25 @@ class VisionAnalysis:
         self.ollama_url = ollama_url
         self.model = "llava:7b"  # Default vision model
         self.enabled = False  # Disabled by default, enable via config
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+        # Strong references so pending analyses aren't garbage-collected
+        self._background_tasks: set[asyncio.Task] = set()
+
+    def run_in_background(self, coro: Coroutine) -> None:
+        """Run an analysis off the response path, at most MAX_CONCURRENT_ANALYSES at once."""
+        async def gated():
+            async with self._semaphore:
+                await coro
+
+        task = asyncio.create_task(gated())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def cancel_background(self) -> None:
+        """Cancel pending background analyses (on shutdown)."""
+        for task in list(self._background_tasks):
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
 
     async def check_availability(self) -> bool:
         """Check if Ollama is available and has vision model."""
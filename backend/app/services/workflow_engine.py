@@ -20,6 +20,10 @@ from .gpu_registry import GPUNode
 
 logger = logging.getLogger(__name__)
 
+# Parameters that vary per item within a batch; build_workflow_base() records
+# where they live so patch_workflow() can override them without a rebuild
+PATCHABLE_FIELDS = ("seed", "filename_prefix")
+
 
 class WorkflowEngine:
     """Loads workflow templates and builds parameterized ComfyUI workflows."""
@@ -168,6 +172,58 @@ class WorkflowEngine:
 
         return workflow
 
+    def build_workflow_base(
+        self,
+        template_name: str,
+        params: dict,
+        gpu_node: GPUNode | None = None,
+    ) -> tuple[dict, dict[str, list[tuple[str, str]]]] | None:
+        """
+        Build a workflow once for reuse across items that differ only in
+        PATCHABLE_FIELDS.
+
+        Returns (workflow, slots), where slots maps each patchable field to
+        the (node_id, input_key) pairs holding it, or None if the template
+        embeds one of those fields inside a larger string and so cannot be
+        patched in place.
+        """
+        if template_name not in self.templates:
+            raise ValueError(f"Unknown template: {template_name}")
+
+        slots: dict[str, list[tuple[str, str]]] = {f: [] for f in PATCHABLE_FIELDS}
+        for node_id, node in self.templates[template_name].items():
+            for input_key, value in node.get("inputs", {}).items():
+                if not isinstance(value, str) or "{{" not in value:
+                    continue
+                match = re.fullmatch(r"\{\{(\w+)\}\}", value)
+                if match and match.group(1) in slots:
+                    slots[match.group(1)].append((node_id, input_key))
+                elif any(f"{{{{{field}}}}}" in value for field in slots):
+                    return None
+
+        return self.build_workflow(template_name, params, gpu_node), slots
+
+    @staticmethod
+    def patch_workflow(
+        base: dict,
+        slots: dict[str, list[tuple[str, str]]],
+        values: dict,
+    ) -> dict:
+        """
+        Specialize a workflow from build_workflow_base() for one item.
+
+        Only the nodes holding a patched field are copied; every other node
+        is shared with the base workflow, which is left untouched.
+        """
+        workflow = dict(base)
+        for field, value in values.items():
+            for node_id, input_key in slots[field]:
+                node = workflow[node_id]
+                if node is base[node_id]:
+                    node = workflow[node_id] = {**node, "inputs": dict(node["inputs"])}
+                node["inputs"][input_key] = value
+        return workflow
+
     def _substitute(self, obj: dict | list | str | int | float, values: dict):
         """
         Recursively substitute {{variable}} placeholders in the workflow.
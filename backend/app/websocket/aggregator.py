@@ -14,6 +14,7 @@ import logging
 from typing import Any
 
 from fastapi import WebSocket
+import orjson
 import websockets
 from websockets.exceptions import ConnectionClosedError
 
@@ -21,6 +22,14 @@ from ..services.comfyui_client import ComfyUIClientPool
 
 logger = logging.getLogger(__name__)
 
+# Progress events are coalesced per generation and flushed at most this often.
+# Sampling steps can arrive much faster than the UI needs them.
+PROGRESS_FLUSH_INTERVAL = 0.05
+
+# Messages queued with enqueue() are held this long so that bursts (e.g. a
+# batch_progress immediately followed by batch_complete) go out in one frame.
+MESSAGE_FLUSH_INTERVAL = 0.015
+
 
 class ProgressAggregator:
     def __init__(self, pool: ComfyUIClientPool) -> None:
@@ -30,6 +39,11 @@ class ProgressAggregator:
         # session_id -> list of connected frontend WebSockets
         self.session_connections: dict[str, list[WebSocket]] = {}
         self._listener_tasks: list[asyncio.Task] = []
+        # session_id -> {generation_id: latest progress message} awaiting flush
+        self._pending_progress: dict[str, dict[str, dict]] = {}
+        # session_id -> messages queued by enqueue(), in order
+        self._outbox: dict[str, list[dict]] = {}
+        self._flush_tasks: dict[str, asyncio.Task] = {}
 
     def register_prompt(
         self,
@@ -60,6 +74,11 @@ class ProgressAggregator:
         for task in self._listener_tasks:
             task.cancel()
         self._listener_tasks.clear()
+        for task in self._flush_tasks.values():
+            task.cancel()
+        self._flush_tasks.clear()
+        self._pending_progress.clear()
+        self._outbox.clear()
 
     async def _listen_gpu(self, gpu_id: str, ws_url: str, client_id: str) -> None:
         """
@@ -105,6 +124,11 @@ class ProgressAggregator:
         msg_type = msg.get("type")
         data = msg.get("data", {})
 
+        # "executing" with no node means the prompt is done (its history is
+        # already written); wake up whoever is waiting on it
+        if msg_type == "executing" and data.get("node") is None and data.get("prompt_id"):
+            self.pool.get_client(gpu_id).notify_prompt_finished(data["prompt_id"])
+
         # Try to find which session this belongs to
         # ComfyUI sends prompt_id in some message types
         prompt_id = data.get("prompt_id")
@@ -172,32 +196,89 @@ class ProgressAggregator:
                 "message": data.get("exception_message", "Unknown ComfyUI error"),
             }
 
-        if frontend_msg:
+        if frontend_msg is None:
+            return
+
+        if msg_type == "progress":
+            self._queue_progress(session_id, generation_id, frontend_msg)
+        else:
             await self._send_to_session(session_id, frontend_msg)
 
+    def enqueue(self, session_id: str, message: dict) -> None:
+        """Queue a message for the session's next batched flush."""
+        self._drop_superseded_progress(session_id, message)
+        self._outbox.setdefault(session_id, []).append(message)
+        self._schedule_flush(session_id, MESSAGE_FLUSH_INTERVAL)
+
+    def _queue_progress(self, session_id: str, generation_id: str, message: dict) -> None:
+        """Keep only the latest progress message per generation until the next flush."""
+        self._pending_progress.setdefault(session_id, {})[generation_id] = message
+        self._schedule_flush(session_id, PROGRESS_FLUSH_INTERVAL)
+
+    def _schedule_flush(self, session_id: str, delay: float) -> None:
+        if session_id not in self._flush_tasks:
+            self._flush_tasks[session_id] = asyncio.create_task(
+                self._flush_session(session_id, delay)
+            )
+
+    async def _flush_session(self, session_id: str, delay: float) -> None:
+        """Send everything queued for a session after a short delay, in one frame."""
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self._flush_tasks.pop(session_id, None)
+        messages = self._outbox.pop(session_id, [])
+        messages.extend(self._pending_progress.pop(session_id, {}).values())
+        if messages:
+            await self.send_batch(session_id, messages)
+
+    def _drop_superseded_progress(self, session_id: str, message: dict) -> None:
+        """Any other message about a generation supersedes its queued progress."""
+        pending = self._pending_progress.get(session_id)
+        if pending and message.get("type") != "generation_progress":
+            generation_id = message.get("generationId") or message.get("latestResult", {}).get("generationId")
+            pending.pop(generation_id, None)
+
+    async def send_batch(self, session_id: str, messages: list[dict]) -> None:
+        """
+        Send several messages to a session as a single JSON array frame.
+
+        A lone message is still sent as a bare object.
+        """
+        if len(messages) == 1:
+            await self._send_to_session(session_id, messages[0])
+            return
+        await self._send_payload(session_id, orjson.dumps(messages).decode(), "batched")
+
     async def _send_to_session(self, session_id: str, message: dict) -> None:
         """Send a message to all frontend WebSockets connected to a session."""
+        self._drop_superseded_progress(session_id, message)
+        await self._send_payload(session_id, orjson.dumps(message).decode(), message.get("type"))
+
+    async def _send_payload(self, session_id: str, payload: str, kind: str | None) -> None:
+        """Write an encoded frame to every frontend WebSocket of a session."""
         connections = self.session_connections.get(session_id, [])
         if not connections:
             logger.warning("No WebSocket connections for session %s", session_id)
             return
 
-        payload = json.dumps(message)
-        dead: list[WebSocket] = []
-
         logger.debug("Sending %s message to %d connections for session %s",
-                    message.get("type"), len(connections), session_id)
+                    kind, len(connections), session_id)
 
-        for ws in connections:
-            try:
-                await ws.send_text(payload)
-            except Exception as e:
-                logger.error("Failed to send WebSocket message: %s", e)
-                dead.append(ws)
+        # Send to a snapshot so connects/disconnects during the awaits are safe,
+        # and fan out concurrently so one slow client doesn't delay the rest.
+        snapshot = list(connections)
+        results = await asyncio.gather(
+            *(ws.send_text(payload) for ws in snapshot),
+            return_exceptions=True,
+        )
 
         # Clean up dead connections
-        for ws in dead:
-            connections.remove(ws)
+        for ws, result in zip(snapshot, results):
+            if isinstance(result, Exception):
+                logger.error("Failed to send WebSocket message: %s", result)
+                if ws in connections:
+                    connections.remove(ws)
 
     async def connect_frontend(self, session_id: str, ws: WebSocket) -> None:
         """Register a frontend WebSocket for a session."""
@@ -0,0 +1,156 @@
+"""Schema upgrade tests for init_db's upgrade path."""
+
+import asyncio
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.models import orm, preference_orm  # noqa: F401  (register tables)
+from app.models.database import OBSOLETE_INDEXES, SCHEMA_VERSION, upgrade_schema
+
+# Tables and indexes as created by the original (version 0) schema
+BASELINE_DDL = (
+    """CREATE TABLE sessions (
+        id VARCHAR NOT NULL, flow_type VARCHAR NOT NULL, created_at DATETIME,
+        current_stage INTEGER, config JSON, intent_document JSON, PRIMARY KEY (id))""",
+    """CREATE TABLE generations (
+        id VARCHAR NOT NULL, session_id VARCHAR NOT NULL, stage INTEGER NOT NULL,
+        batch_id VARCHAR, batch_index INTEGER, prompt TEXT, negative_prompt TEXT,
+        model_family VARCHAR, checkpoint VARCHAR, task_type VARCHAR, parameters JSON,
+        loras JSON, gpu_id VARCHAR, prompt_comfy_id VARCHAR, image_path VARCHAR,
+        thumbnail_path VARCHAR, seed INTEGER, width INTEGER, height INTEGER,
+        steps INTEGER, cfg_scale FLOAT, denoise_strength FLOAT,
+        generation_time_ms INTEGER, status VARCHAR, error_message TEXT,
+        created_at DATETIME, PRIMARY KEY (id))""",
+    "CREATE INDEX ix_generations_batch_id ON generations (batch_id)",
+    "CREATE INDEX ix_generations_session_id ON generations (session_id)",
+    """CREATE TABLE user_preferences (
+        id VARCHAR(36) NOT NULL, timestamp DATETIME NOT NULL, user_id VARCHAR(36) NOT NULL,
+        prompt TEXT NOT NULL, keywords TEXT NOT NULL, negative_prompt TEXT,
+        checkpoint VARCHAR(255) NOT NULL, loras TEXT NOT NULL,
+        model_family VARCHAR(50) NOT NULL, task_type VARCHAR(50) NOT NULL,
+        action VARCHAR(50) NOT NULL, feedback_text TEXT, stage INTEGER NOT NULL,
+        session_id VARCHAR(36) NOT NULL, generation_id VARCHAR(36) NOT NULL,
+        vision_description TEXT, vision_themes TEXT, PRIMARY KEY (id))""",
+    "CREATE INDEX idx_action ON user_preferences (action)",
+    "CREATE INDEX idx_session ON user_preferences (session_id)",
+    "CREATE INDEX idx_checkpoint ON user_preferences (checkpoint)",
+    "CREATE INDEX idx_user_timestamp ON user_preferences (user_id, timestamp)",
+    "CREATE INDEX idx_keywords ON user_preferences (keywords)",
+    """CREATE TABLE preference_stats (
+        id VARCHAR(36) NOT NULL, user_id VARCHAR(36) NOT NULL, stat_type VARCHAR(50) NOT NULL,
+        "key" VARCHAR(512) NOT NULL, selected_count INTEGER NOT NULL, total_count INTEGER NOT NULL,
+        selection_rate FLOAT NOT NULL, confidence_score FLOAT NOT NULL,
+        last_updated DATETIME NOT NULL, PRIMARY KEY (id))""",
+    "CREATE INDEX idx_stat_type ON preference_stats (stat_type)",
+    'CREATE UNIQUE INDEX idx_user_stat_key ON preference_stats (user_id, stat_type, "key")',
+    """CREATE TABLE image_cleanup (
+        id VARCHAR(36) NOT NULL, generation_id VARCHAR(36) NOT NULL,
+        image_path VARCHAR(512) NOT NULL, rejected BOOLEAN NOT NULL,
+        vision_analyzed BOOLEAN NOT NULL, ready_for_cleanup BOOLEAN NOT NULL,
+        rejected_at DATETIME, analyzed_at DATETIME, PRIMARY KEY (id))""",
+    "CREATE INDEX idx_cleanup_status ON image_cleanup (ready_for_cleanup, rejected_at)",
+)
+
+STAT_ID = "6f1c2b3a-4d5e-4f60-8a9b-0c1d2e3f4a5b"
+GENERATION_ID = "0a1b2c3d-4e5f-4a6b-8c7d-8e9f0a1b2c3d"
+
+
+class UpgradeSchemaTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "imgen.db"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _upgrade(self):
+        async def run():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{self.db_path}")
+            async with engine.begin() as conn:
+                await upgrade_schema(conn)
+            await engine.dispose()
+        asyncio.run(run())
+
+    def _create_baseline(self):
+        with sqlite3.connect(self.db_path) as conn:
+            for statement in BASELINE_DDL:
+                conn.execute(statement)
+
+    def _indexes(self, table):
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?",
+                (table,),
+            )
+            return {name for (name,) in rows if not name.startswith("sqlite_autoindex")}
+
+    def test_baseline_database_gets_new_indexes(self):
+        self._create_baseline()
+
+        self._upgrade()
+
+        self.assertEqual(
+            self._indexes("generations"),
+            {"ix_gen_batch_status", "ix_gen_session_stage_created"},
+        )
+        self.assertEqual(
+            self._indexes("user_preferences"),
+            {"idx_user_timestamp", "idx_user_checkpoint_action", "idx_user_action_ts", "idx_session"},
+        )
+        with sqlite3.connect(self.db_path) as conn:
+            all_indexes = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+        self.assertFalse(all_indexes & set(OBSOLETE_INDEXES))
+        self.assertEqual(version, SCHEMA_VERSION)
+
+    def test_upgrade_is_idempotent(self):
+        self._upgrade()
+        first = self._indexes("generations")
+        self._upgrade()
+        self.assertEqual(self._indexes("generations"), first)
+
+    def test_legacy_text_ids_are_updatable_after_upgrade(self):
+        self._create_baseline()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO preference_stats VALUES (?, 'default', 'checkpoint_overall', 'ckpt',"
+                " 1, 2, 0.5, 0.1, '2024-01-01 00:00:00')",
+                (STAT_ID,),
+            )
+            conn.execute(
+                "INSERT INTO image_cleanup VALUES (?, ?, 'a.png', 1, 0, 0, NULL, NULL)",
+                (STAT_ID, GENERATION_ID),
+            )
+
+        self._upgrade()
+
+        with sqlite3.connect(self.db_path) as conn:
+            types = conn.execute(
+                "SELECT typeof(s.id), typeof(c.id), typeof(c.generation_id)"
+                " FROM preference_stats s, image_cleanup c"
+            ).fetchone()
+        self.assertEqual(types, ("blob", "blob", "blob"))
+
+        async def increment():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{self.db_path}")
+            async with async_sessionmaker(engine)() as db:
+                stat = (await db.execute(select(preference_orm.PreferenceStatsORM))).scalar_one()
+                self.assertEqual(stat.id, STAT_ID)
+                stat.selected_count += 1
+                stat.total_count += 1
+                await db.commit()
+            await engine.dispose()
+        asyncio.run(increment())
+
+        with sqlite3.connect(self.db_path) as conn:
+            counts = conn.execute("SELECT selected_count, total_count FROM preference_stats").fetchone()
+        self.assertEqual(counts, (2, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""Tests for model cache recommendations."""
+
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import models
+from app.services.model_sync import ModelInfo, ModelSyncManager
+
+
+def _manager_with_hot_checkpoints(count: int) -> ModelSyncManager:
+    manager = ModelSyncManager()
+    for i in range(count):
+        name = f"ckpt{i}.safetensors"
+        manager.nas_checkpoints[name] = ModelInfo(
+            name=name, path=f"checkpoints/{name}", size_mb=0,
+            model_type="checkpoint", family="sdxl",
+        )
+        for _ in range(3):
+            manager.record_model_usage(name)
+    return manager
+
+
+class RecommendCacheTest(unittest.TestCase):
+    def test_stops_at_max_items(self):
+        manager = _manager_with_hot_checkpoints(5)
+        result = manager.recommend_cache_for_node("gpu-premium", max_items=2)
+        self.assertEqual(result["checkpoints"], ["ckpt0.safetensors", "ckpt1.safetensors"])
+
+    def test_negative_max_items_returns_nothing(self):
+        manager = _manager_with_hot_checkpoints(3)
+        result = manager.recommend_cache_for_node("gpu-premium", max_items=-1)
+        self.assertEqual(result, {"checkpoints": [], "loras": []})
+
+    def test_route_rejects_negative_max_items(self):
+        app = FastAPI()
+        app.include_router(models.router)
+        app.state.model_sync = _manager_with_hot_checkpoints(3)
+        client = TestClient(app)
+
+        response = client.get("/api/models/recommend-cache", params={"node_id": "gpu-premium", "max_items": -1})
+        self.assertEqual(response.status_code, 422)
+
+        response = client.get("/api/models/recommend-cache", params={"node_id": "gpu-premium", "max_items": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["checkpoints"], ["ckpt0.safetensors"])
+
+
+if __name__ == "__main__":
+    unittest.main()
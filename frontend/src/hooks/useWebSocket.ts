@@ -29,8 +29,13 @@ export function useWebSocket(sessionId: string | null) {
 
       ws.onmessage = (event) => {
         try {
-          const msg: WSMessage = JSON.parse(event.data);
-          handleMessage(msg);
+          // The backend batches bursts of messages into a single array frame
+          const data: WSMessage | WSMessage[] = JSON.parse(event.data);
+          if (Array.isArray(data)) {
+            data.forEach(handleMessage);
+          } else {
+            handleMessage(data);
+          }
         } catch {
           // ignore non-JSON messages
         }